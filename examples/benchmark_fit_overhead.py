@@ -0,0 +1,88 @@
+"""
+Measure per-step overhead of callback dispatch in `kblocks.models.fit`.
+
+A tiny model is trained so time per step is dominated by python overhead. Compares:
+    - fast: no callbacks implementing batch hooks, no progress bar;
+    - hooks: a no-op callback implementing batch hooks;
+    - progbar: keras' per-step `ProgbarLogger`;
+    - throttled: `ThrottledProgbarLogger` (default for `verbose=True`).
+
+Example usage:
+```bash
+python benchmark_fit_overhead.py --steps=2000 --steps_per_execution=1
+```
+"""
+import time
+
+import tensorflow as tf
+from absl import app, flags
+
+from kblocks.extras.callbacks import ThrottledProgbarLogger
+from kblocks.models import compiled, fit
+
+flags.DEFINE_integer("steps", default=1000, help="Steps per epoch.")
+flags.DEFINE_integer("epochs", default=2, help="Epochs, the first is warmup.")
+flags.DEFINE_integer("steps_per_execution", default=1, help="Steps per execution.")
+
+
+class NoOpBatchCallback(tf.keras.callbacks.Callback):
+    def on_train_batch_end(self, batch, logs=None):
+        pass
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.times = []
+        self._start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._start)
+
+
+def time_per_step(callbacks, verbose: bool) -> float:
+    FLAGS = flags.FLAGS
+    dataset = tf.data.Dataset.from_tensors(
+        (tf.zeros((8, 4)), tf.zeros((8, 1)))
+    ).repeat()
+    model = tf.keras.Sequential([tf.keras.layers.Dense(1, input_shape=(4,))])
+    compiled(
+        model,
+        loss="mse",
+        optimizer="sgd",
+        steps_per_execution=FLAGS.steps_per_execution,
+    )
+    timer = EpochTimer()
+    fit(
+        model,
+        dataset,
+        epochs=FLAGS.epochs,
+        steps_per_epoch=FLAGS.steps,
+        callbacks=[*callbacks, timer],
+        verbose=verbose,
+    )
+    return min(timer.times[1:]) / FLAGS.steps
+
+
+def main(_):
+    results = {
+        "fast": time_per_step([], verbose=False),
+        "hooks": time_per_step([NoOpBatchCallback()], verbose=False),
+        "progbar": time_per_step(
+            [tf.keras.callbacks.ProgbarLogger(count_mode="steps")], verbose=True
+        ),
+        "throttled": time_per_step([ThrottledProgbarLogger()], verbose=True),
+    }
+    base = results["fast"]
+    for name, dt in results.items():
+        print(
+            f"{name.ljust(10)}: {dt * 1e6:8.1f} us/step, "
+            f"overhead {(dt - base) * 1e6:8.1f} us/step"
+        )
+
+
+if __name__ == "__main__":
+    app.run(main)
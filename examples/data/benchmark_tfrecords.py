@@ -0,0 +1,67 @@
+"""
+Compare tfrecords cache formats or codecs on point-cloud-like elements.
+
+Example usage:
+```bash
+python benchmark_tfrecords.py --num_elements=10000 --block_size=64 --block_size=256
+python benchmark_tfrecords.py --codecs --chunk_size=128 --num_parallel_calls=-1
+```
+"""
+import tensorflow as tf
+from absl import app, flags
+
+from kblocks.data.benchmarks import (
+    benchmark_tfrecords_codecs,
+    benchmark_tfrecords_formats,
+)
+
+flags.DEFINE_integer("num_elements", default=2048, help="Elements in dataset.")
+flags.DEFINE_integer("max_points", default=1024, help="Maximum points per cloud.")
+flags.DEFINE_integer("num_epochs", default=2, help="Epochs to read per format.")
+flags.DEFINE_integer(
+    "num_parallel_calls", default=1, help="Deserialization parallelism. -1 = AUTOTUNE"
+)
+flags.DEFINE_multi_integer(
+    "block_size", default=[], help="Block sizes to decode flat records with."
+)
+flags.DEFINE_bool("codecs", default=False, help="Compare codecs rather than formats.")
+flags.DEFINE_integer("chunk_size", default=64, help="Records per compressed chunk.")
+
+
+def get_dataset(num_elements: int, max_points: int) -> tf.data.Dataset:
+    def map_func(seed):
+        seed = tf.stack((seed, 0))
+        num_points = tf.random.stateless_uniform(
+            (), seed, minval=1, maxval=max_points, dtype=tf.int32
+        )
+        coords = tf.random.stateless_normal((num_points, 3), seed)
+        normals = tf.RaggedTensor.from_row_lengths(
+            tf.reshape(coords, (-1,)), tf.fill((num_points,), 3)
+        )
+        label = tf.cast(num_points % 10, tf.int64)
+        return (coords, normals), label
+
+    return tf.data.Dataset.range(num_elements).map(map_func)
+
+
+def main(_):
+    FLAGS = flags.FLAGS
+    dataset = get_dataset(FLAGS.num_elements, FLAGS.max_points)
+    if FLAGS.codecs:
+        benchmark_tfrecords_codecs(
+            dataset,
+            chunk_size=FLAGS.chunk_size,
+            num_epochs=FLAGS.num_epochs,
+            num_parallel_calls=FLAGS.num_parallel_calls,
+        )
+        return
+    benchmark_tfrecords_formats(
+        dataset,
+        block_sizes=[None, *FLAGS.block_size],
+        num_epochs=FLAGS.num_epochs,
+        num_parallel_calls=FLAGS.num_parallel_calls,
+    )
+
+
+if __name__ == "__main__":
+    app.run(main)
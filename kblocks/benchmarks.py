@@ -1,6 +1,22 @@
-"""Utilities for reporting results from `tf.test.Benchmark.run_op_benchmark`."""
+"""
+Benchmarks for models and datasets.
+
+`benchmark_function`, `benchmark_model` and `benchmark_dataset` time eager / tf.function
+execution as used in `kblocks.models.fit`. `benchmark_op` and `summarize` are for
+graph-mode ops via `tf.test.Benchmark.run_op_benchmark`.
+"""
+import json
+import os
+import platform
+import time
+from typing import Any, Callable, Dict, Optional
+
 import gin
+import numpy as np
 import tensorflow as tf
+from absl import logging
+
+from kblocks.data.tuner import PeakRSS
 
 
 def summarize(result, print_fn=print):
@@ -49,17 +65,186 @@ def as_inputs(dataset):
     return as_iterator(dataset).get_next()
 
 
+def _allocator_peak_bytes(device: str) -> Optional[int]:
+    """Get peak bytes allocated on `device`, or None if not supported."""
+    try:
+        return tf.config.experimental.get_memory_info(device)["peak"]
+    except (AttributeError, ValueError, NotImplementedError):
+        # not available in older tensorflow versions / for some devices
+        return None
+
+
+def _reset_allocator_stats(device: str):
+    try:
+        tf.config.experimental.reset_memory_stats(device)
+    except (AttributeError, ValueError):
+        pass
+
+
+def _sync(outputs):
+    # outputs of a single function call, so waiting for one waits for all
+    flat = tf.nest.flatten(outputs, expand_composites=True)
+    if flat and isinstance(flat[0], tf.Tensor):
+        flat[0].numpy()
+
+
+@gin.configurable(module="kb.benchmarks")
+def benchmark_function(
+    func: Callable[[], Any],
+    num_warmup: int = 10,
+    num_steps: int = 100,
+    batch_size: Optional[int] = None,
+    device: str = "CPU:0",
+    output_path: Optional[str] = None,
+    name: str = "benchmark",
+    print_fn: Callable[[str], None] = logging.info,
+) -> Dict[str, Any]:
+    """
+    Time calls to `func` in eager mode.
+
+    Each call's outputs are waited for before the next call, so latencies include
+    all work done by `func`.
+
+    Args:
+        func: function to benchmark, e.g. `lambda: train_function(iterator)`.
+        num_warmup: number of untimed calls before timing. The first includes
+            tracing, and is reported separately.
+        num_steps: number of timed calls.
+        batch_size: number of examples per call, used for `examples_per_sec`.
+        device: device for allocator statistics, e.g. "CPU:0" or "GPU:0".
+        output_path: if given, results are written as json to this path.
+        name: name included in results.
+        print_fn: function used to print a summary.
+
+    Returns:
+        dict with:
+            name, num_steps, batch_size
+            first_step_ms: time of the first warmup call.
+            warmup_sec: total time of warmup calls.
+            mean_ms, p50_ms, p90_ms, p99_ms, max_ms: step latency statistics.
+            steps_per_sec, examples_per_sec (None if batch_size is None).
+            peak_rss: peak resident memory of this process (bytes).
+            peak_rss_increase: `peak_rss` minus resident memory before the first
+                call (bytes). Use this for host memory, e.g. when benchmarking on
+                CPU.
+            allocator_peak_bytes: peak bytes allocated on `device`. None if memory
+                info isn't supported for `device`.
+            tf_version, host, timestamp.
+    """
+    assert tf.executing_eagerly()
+    _reset_allocator_stats(device)
+    with PeakRSS() as rss:
+        t = time.perf_counter()
+        first_step = None
+        for _ in range(num_warmup):
+            _sync(func())
+            if first_step is None:
+                first_step = time.perf_counter() - t
+        warmup = time.perf_counter() - t
+
+        times = np.empty((num_steps,))
+        t = time.perf_counter()
+        for i in range(num_steps):
+            _sync(func())
+            now = time.perf_counter()
+            times[i] = now - t
+            t = now
+    total = times.sum()
+    result = dict(
+        name=name,
+        num_steps=num_steps,
+        batch_size=batch_size,
+        first_step_ms=None if first_step is None else 1000 * first_step,
+        warmup_sec=warmup,
+        mean_ms=1000 * total / num_steps,
+        p50_ms=1000 * np.percentile(times, 50),
+        p90_ms=1000 * np.percentile(times, 90),
+        p99_ms=1000 * np.percentile(times, 99),
+        max_ms=1000 * times.max(),
+        steps_per_sec=num_steps / total,
+        examples_per_sec=None if batch_size is None else num_steps * batch_size / total,
+        peak_rss=rss.peak,
+        peak_rss_increase=rss.increase,
+        allocator_peak_bytes=_allocator_peak_bytes(device),
+        tf_version=tf.__version__,
+        host=platform.node(),
+        timestamp=time.time(),
+    )
+    print_fn(
+        "\n".join(
+            [f"Benchmark {name}"]
+            + [f"{k.ljust(20)}: {v}" for k, v in result.items() if k != "name"]
+        )
+    )
+    if output_path is not None:
+        dirname = os.path.dirname(output_path)
+        if dirname:
+            tf.io.gfile.makedirs(dirname)
+        with tf.io.gfile.GFile(output_path, "w") as fp:
+            json.dump(result, fp, indent=2)
+    return result
+
+
+def _batch_size(element) -> Optional[int]:
+    flat = tf.nest.flatten(element, expand_composites=True)
+    if not flat or flat[0].shape.ndims == 0:
+        return None
+    return int(tf.shape(flat[0])[0])
+
+
 @gin.configurable(module="kb.benchmarks")
 def benchmark_dataset(dataset: tf.data.Dataset, **kwargs):
-    return benchmark_op(as_inputs(dataset.repeat()), **kwargs)
+    """
+    Benchmark iterating over `dataset`.
+
+    In graph mode, `kwargs` are passed to `benchmark_op`, otherwise to
+    `benchmark_function`.
+    """
+    if dataset.cardinality() != tf.data.INFINITE_CARDINALITY:
+        dataset = dataset.repeat()
+    if not tf.executing_eagerly():
+        return benchmark_op(as_inputs(dataset), **kwargs)
+    it = iter(dataset)
+    if "batch_size" not in kwargs:
+        kwargs["batch_size"] = _batch_size(next(it))
+    kwargs.setdefault("name", "dataset")
+    return benchmark_function(lambda: next(it), **kwargs)
 
 
 @gin.configurable(module="kb.benchmarks")
 def benchmark_model(
     model: tf.keras.Model, dataset: tf.data.Dataset, inference_only=False, **kwargs
 ):
+    """
+    Benchmark model training or inference steps.
+
+    In eager mode, this times `model.make_train_function()` (or
+    `make_predict_function()` if `inference_only`) on an iterator of `dataset`, as
+    used in `kblocks.models.fit`, and `kwargs` are passed to `benchmark_function`.
+    Each timed call runs `steps_per_execution` steps if the model was compiled with
+    it.
+    In graph mode, a single gradient update op is timed with `benchmark_op`.
+    """
     if dataset.cardinality() != tf.data.INFINITE_CARDINALITY:
         dataset = dataset.repeat()
+    if tf.executing_eagerly():
+        it = iter(dataset)
+        model_func = (
+            model.make_predict_function()
+            if inference_only
+            else model.make_train_function()
+        )
+        if "batch_size" not in kwargs:
+            # consumes an element, but remaining elements are unaffected
+            batch_size = _batch_size(next(it))
+            steps_var = getattr(model, "_steps_per_execution", None)
+            if batch_size is not None and steps_var is not None:
+                # each call runs `steps_per_execution` steps
+                batch_size *= int(steps_var.numpy())
+            kwargs["batch_size"] = batch_size
+        kwargs.setdefault("name", "predict" if inference_only else "train")
+        return benchmark_function(lambda: model_func(it), **kwargs)
+
     inputs, labels, sample_weight = tf.keras.utils.unpack_x_y_sample_weight(
         as_inputs(dataset)
     )
@@ -1,4 +1,13 @@
-from .cache import save_load_cache, tfrecords_cache
+from .bucket import bucketed_batch
+from .cache import (
+    chunked_save_load,
+    content_addressed_cache,
+    indexed_cache,
+    managed_cache,
+    mmap_cache,
+    save_load_cache,
+    tfrecords_cache,
+)
 from .core import (
     Transform,
     apply,
@@ -23,9 +32,23 @@ from .core import (
     unbatch,
     with_options,
 )
-from .repeated import RepeatedData, dataset_and_steps, repeated_data
+from .instrument import PipelineStats, get_pipeline_stats, instrumented_transform
+from .metadata import declared_cardinality
+from .repeated import (
+    RepeatedData,
+    dataset_and_steps,
+    repeated_data,
+    sharded_repeated_data,
+)
+from .seekable import SeekableData, seekable_indexed_data
 
 __all__ = [
+    "bucketed_batch",
+    "chunked_save_load",
+    "content_addressed_cache",
+    "indexed_cache",
+    "managed_cache",
+    "mmap_cache",
     "save_load_cache",
     "tfrecords_cache",
     "Transform",
@@ -50,7 +73,14 @@ __all__ = [
     "take",
     "unbatch",
     "with_options",
+    "PipelineStats",
+    "get_pipeline_stats",
+    "instrumented_transform",
+    "declared_cardinality",
     "RepeatedData",
     "repeated_data",
     "dataset_and_steps",
+    "sharded_repeated_data",
+    "SeekableData",
+    "seekable_indexed_data",
 ]
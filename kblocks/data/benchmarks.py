@@ -0,0 +1,174 @@
+"""Utilities for benchmarking cache formats in `kblocks.data`."""
+import tempfile
+import time
+from typing import Callable, Iterable, Mapping, Optional
+
+import gin
+import tensorflow as tf
+
+from kblocks.data import tfrecords
+from kblocks.data.manager import dir_size
+
+CacheFn = Callable[[tf.data.Dataset, str], tf.data.Dataset]
+
+
+def _num_elements(dataset: tf.data.Dataset) -> int:
+    return tf.keras.backend.get_value(dataset.reduce(0, lambda count, _: count + 1))
+
+
+def benchmark_cache(
+    dataset: tf.data.Dataset, cache_fn: CacheFn, num_epochs: int = 2
+) -> Mapping[str, float]:
+    """
+    Benchmark writing then reading a cache of `dataset`.
+
+    Elements are consumed with `tf.data.Dataset.reduce` so Python iteration overhead
+    is not included in read times.
+
+    Args:
+        dataset: finite dataset to cache.
+        cache_fn: function mapping `(dataset, cache_dir)` to a cached dataset. Files
+            must be written eagerly.
+        num_epochs: number of epochs to read.
+
+    Returns:
+        dict with "write_time" and "read_time" in seconds, "disk_bytes",
+        "write_elements_per_sec" and "read_elements_per_sec".
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        t = time.perf_counter()
+        cached = cache_fn(dataset, cache_dir)
+        write_time = time.perf_counter() - t
+        disk_bytes = dir_size(cache_dir)
+        t = time.perf_counter()
+        num_elements = sum(_num_elements(cached) for _ in range(num_epochs))
+        read_time = time.perf_counter() - t
+    return dict(
+        write_time=write_time,
+        disk_bytes=disk_bytes,
+        read_time=read_time,
+        write_elements_per_sec=num_elements / num_epochs / write_time,
+        read_elements_per_sec=num_elements / read_time,
+    )
+
+
+def summarize_all(results: Mapping[str, Mapping[str, float]], print_fn=print):
+    """Print results from `benchmark_cache` keyed by name as a table."""
+    keys = (
+        "write_time",
+        "disk_bytes",
+        "read_time",
+        "write_elements_per_sec",
+        "read_elements_per_sec",
+    )
+    name_len = max(len(name) for name in results)
+    print_fn(" ".join([" " * name_len] + [k.rjust(22) for k in keys]))
+    for name, result in results.items():
+        print_fn(
+            " ".join([name.ljust(name_len)] + [f"{result[k]:22.3f}" for k in keys])
+        )
+
+
+@gin.configurable(module="kb.data")
+def benchmark_tfrecords_formats(
+    dataset: tf.data.Dataset,
+    record_formats: Iterable[str] = tfrecords.RECORD_FORMATS,
+    block_sizes: Iterable[Optional[int]] = (None,),
+    num_epochs: int = 2,
+    num_parallel_calls: int = 1,
+    print_fn=print,
+    **kwargs,
+) -> Mapping[str, Mapping[str, float]]:
+    """
+    Compare `tfrecords.tfrecords_cache` with different `record_format`s.
+
+    Args:
+        dataset: finite dataset to cache.
+        record_formats: formats to compare.
+        block_sizes: `block_size`s to compare for "flat" records.
+        num_epochs: number of epochs to read per format.
+        num_parallel_calls: used in deserialization.
+        print_fn: print-like function used to summarize results.
+        **kwargs: passed to `tfrecords.tfrecords_cache`.
+
+    Returns:
+        dict mapping record format (and block size) to `benchmark_cache` results.
+    """
+    configs = []
+    for record_format in record_formats:
+        if record_format == "flat":
+            configs.extend((record_format, block_size) for block_size in block_sizes)
+        else:
+            configs.append((record_format, None))
+
+    results = {}
+    for record_format, block_size in configs:
+
+        def cache_fn(
+            dataset, cache_dir, record_format=record_format, block_size=block_size
+        ):
+            return tfrecords.tfrecords_cache(
+                dataset,
+                cache_dir,
+                num_parallel_calls=num_parallel_calls,
+                record_format=record_format,
+                block_size=block_size,
+                **kwargs,
+            )
+
+        name = record_format if block_size is None else f"{record_format}-{block_size}"
+        results[name] = benchmark_cache(dataset, cache_fn, num_epochs)
+    summarize_all(results, print_fn=print_fn)
+    return results
+
+
+@gin.configurable(module="kb.data")
+def benchmark_tfrecords_codecs(
+    dataset: tf.data.Dataset,
+    chunk_codecs: Iterable[str] = tfrecords.CHUNK_CODECS,
+    stream_codecs: Iterable[str] = ("GZIP",),
+    chunk_size: int = 64,
+    num_epochs: int = 2,
+    num_parallel_calls: int = 1,
+    print_fn=print,
+    **kwargs,
+) -> Mapping[str, Mapping[str, float]]:
+    """
+    Compare compression options of `tfrecords.tfrecords_cache`.
+
+    Args:
+        dataset: finite dataset to cache.
+        chunk_codecs: `chunk_codec`s to compare.
+        stream_codecs: `compression` types to compare. These apply to entire files.
+        chunk_size: number of records per chunk for `chunk_codecs`.
+        num_epochs: number of epochs to read per codec.
+        num_parallel_calls: used in decompression and deserialization.
+        print_fn: print-like function used to summarize results.
+        **kwargs: passed to `tfrecords.tfrecords_cache`.
+
+    Returns:
+        dict mapping codec name to `benchmark_cache` results.
+    """
+    configs = {"none": {}}
+    for codec in stream_codecs:
+        configs[f"stream-{codec}"] = dict(compression=codec)
+    for codec in chunk_codecs:
+        configs[f"chunk{chunk_size}-{codec or 'raw'}"] = dict(
+            chunk_codec=codec, chunk_size=chunk_size
+        )
+
+    results = {}
+    for name, config in configs.items():
+
+        def cache_fn(dataset, cache_dir, config=config):
+            return tfrecords.tfrecords_cache(
+                dataset,
+                cache_dir,
+                num_parallel_calls=num_parallel_calls,
+                **config,
+                **kwargs,
+            )
+
+        results[name] = benchmark_cache(dataset, cache_fn, num_epochs)
+    summarize_all(results, print_fn=print_fn)
+    return results
@@ -0,0 +1,64 @@
+import numpy as np
+import tensorflow as tf
+
+from kblocks.data.bucket import arrival_order_stats, bucket_stats, bucketed_batch
+from kblocks.data.repeated import RepeatedData
+
+
+def get_dataset(lengths):
+    return tf.data.Dataset.from_tensor_slices(lengths).map(
+        lambda n: tf.range(n, dtype=tf.int64)
+    )
+
+
+def length_func(x):
+    return tf.size(x)
+
+
+class BucketTest(tf.test.TestCase):
+    def test_bucket_stats(self):
+        lengths = np.array([1, 8, 2, 9, 1, 8])
+        stats = bucket_stats(lengths, (5,), (2, 2))
+        self.assertEqual(stats["num_batches"], 4)
+        self.assertAllClose(stats["padding_waste"], 1 - 29 / 31)
+        baseline = arrival_order_stats(lengths, 2)
+        self.assertEqual(baseline["num_batches"], 3)
+        self.assertAllClose(baseline["padding_waste"], 1 - 29 / 50)
+        stats = bucket_stats(lengths, (5,), (2, 4), drop_remainder=True)
+        self.assertEqual(stats["num_batches"], 1)
+
+    def test_token_budget(self):
+        lengths = np.random.default_rng(0).integers(1, 20, size=100)
+        dataset = get_dataset(lengths).apply(
+            bucketed_batch(length_func, (5, 10), max_tokens=40)
+        )
+        batches = list(dataset.as_numpy_iterator())
+        self.assertEqual(len(batches), dataset.cardinality().numpy())
+        self.assertEqual(sum(b.shape[0] for b in batches), lengths.size)
+        for b in batches:
+            self.assertLessEqual(b.size, 40)
+
+    def test_ragged_repeated(self):
+        lengths = np.random.default_rng(0).integers(1, 20, size=50)
+        dataset = (
+            get_dataset(lengths)
+            .shuffle(50, seed=0, reshuffle_each_iteration=True)
+            .apply(bucketed_batch(length_func, (5, 10), batch_size=4, ragged=True))
+        )
+        data = RepeatedData(dataset)
+        it = iter(data.dataset)
+        # cardinality assertions fail if any epoch has a different number of batches
+        for _ in range(3 * data.steps_per_epoch):
+            batch = next(it)
+            self.assertIsInstance(batch, tf.RaggedTensor)
+            self.assertLessEqual(batch.nrows(), 4)
+
+    def test_args(self):
+        with self.assertRaises(ValueError):
+            bucketed_batch(length_func, (5,))
+        with self.assertRaises(ValueError):
+            bucketed_batch(length_func, (5,), max_tokens=10, batch_size=2)
+
+
+if __name__ == "__main__":
+    tf.test.main()
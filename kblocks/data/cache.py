@@ -1,12 +1,155 @@
+import functools
+import json
 import os
-from typing import Callable, Optional, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
 
 import gin
 import tensorflow as tf
 from absl import logging
 
+import kblocks.data.indexed as indexed_lib
+import kblocks.data.manager as manager_lib
+import kblocks.data.mmap as mmap_lib
 import kblocks.data.tfrecords as tfrecords_lib
+from kblocks.data import fingerprint as fingerprint_lib
+from kblocks.data import metadata
 from kblocks.data.core import Transform, cache
+from kblocks.path import expand
+from kblocks.utils import write_json
+
+MANIFEST = "manifest.json"
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    manifest_path = os.path.join(path, MANIFEST)
+    if not tf.io.gfile.exists(manifest_path):
+        return None
+    with tf.io.gfile.GFile(manifest_path, "r") as fp:
+        return json.load(fp)
+
+
+def _write_manifest(path: str, manifest: dict):
+    write_json(os.path.join(path, MANIFEST), manifest)
+
+
+def _chunk_path(path: str, index: int) -> str:
+    return os.path.join(path, f"chunk-{index:05d}")
+
+
+def _save_chunks(
+    dataset_fn: Callable[[int], tf.data.Dataset],
+    path: str,
+    chunk_size: int,
+    compression: Optional[str],
+    shard_func: Optional[Callable],
+) -> dict:
+    """
+    Save a dataset in chunks, resuming from any chunks already completed.
+
+    `dataset_fn(start)` should return the dataset from element `start` onwards. It is
+    called at most once.
+    """
+    manifest = _read_manifest(path)
+    if manifest is None:
+        manifest = dict(chunk_size=chunk_size, num_elements=0, num_chunks=0)
+    elif manifest["chunk_size"] != chunk_size:
+        raise ValueError(
+            f"chunk_size {chunk_size} inconsistent with existing manifest at {path}: "
+            f"{manifest}"
+        )
+    if manifest.get("complete", False):
+        return manifest
+
+    num_elements = manifest["num_elements"]
+    if num_elements:
+        logging.info(
+            f"Resuming save of dataset to {path} from element {num_elements} "
+            f"({manifest['num_chunks']} chunks complete)"
+        )
+    else:
+        logging.info(f"Saving dataset to {path} in chunks of {chunk_size}")
+    # a single iterator is shared between chunks, so the upstream pipeline is only
+    # run once. Resumed saves start from the first incomplete element.
+    dataset = dataset_fn(num_elements)
+    iterator = iter(dataset)
+    exhausted = False
+    chunk_count = 0
+    error = None
+
+    def gen():
+        nonlocal exhausted, chunk_count, error
+        for _ in range(chunk_size):
+            try:
+                el = next(iterator)
+            except StopIteration:
+                exhausted = True
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                # raised after `save` completes - errors inside `save` can hang
+                error = e
+                return
+            chunk_count += 1
+            yield el
+
+    while not exhausted:
+        chunk_count = 0
+        chunk = tf.data.Dataset.from_generator(
+            gen, output_signature=dataset.element_spec
+        )
+        chunk_path = _chunk_path(path, manifest["num_chunks"])
+        tmp_path = f"{chunk_path}.tmp"
+        if tf.io.gfile.exists(tmp_path):
+            tf.io.gfile.rmtree(tmp_path)
+        tf.data.experimental.save(
+            chunk, path=tmp_path, compression=compression, shard_func=shard_func
+        )
+        if error is not None:
+            tf.io.gfile.rmtree(tmp_path)
+            raise error
+        if chunk_count == 0 and manifest["num_chunks"] > 0:
+            # dataset size was a multiple of chunk_size
+            tf.io.gfile.rmtree(tmp_path)
+            break
+        if tf.io.gfile.exists(chunk_path):
+            tf.io.gfile.rmtree(chunk_path)
+        tf.io.gfile.rename(tmp_path, chunk_path)
+        manifest["num_chunks"] += 1
+        manifest["num_elements"] += chunk_count
+        _write_manifest(path, manifest)
+        logging.info(
+            f"Saved chunk {manifest['num_chunks']} to {chunk_path} "
+            f"({manifest['num_elements']} elements total)"
+        )
+    manifest["complete"] = True
+    _write_manifest(path, manifest)
+    return manifest
+
+
+def _load_chunks(
+    path: str,
+    manifest: dict,
+    element_spec,
+    compression: Optional[str],
+    reader_func: Optional[Callable],
+) -> tf.data.Dataset:
+    datasets = [
+        tf.data.experimental.load(
+            path=_chunk_path(path, i),
+            element_spec=element_spec,
+            compression=compression,
+            reader_func=reader_func,
+        )
+        for i in range(manifest["num_chunks"])
+    ]
+    if len(datasets) == 1:
+        return datasets[0]
+    chunk_size = manifest["chunk_size"]
+    choices = tf.data.Dataset.range(manifest["num_elements"]).map(
+        lambda i: i // chunk_size
+    )
+    return tf.data.experimental.choose_from_datasets(datasets, choices)
 
 
 @gin.configurable(module="kb.data")
@@ -15,11 +158,45 @@ def save_load_cache(
     compression: Optional[str] = None,
     shard_func: Optional[Callable] = None,
     reader_func: Optional[Callable] = None,
+    chunk_size: Optional[int] = None,
 ) -> Transform:
-    """Cache transform that uses `tf.data.experimental.[save,load]`."""
+    """
+    Cache transform that uses `tf.data.experimental.[save,load]`.
+
+    Args:
+        path: directory to save to / load from.
+        compression: used in save/load.
+        shard_func: used in save.
+        reader_func: used in load.
+        chunk_size: if given, the dataset is saved in chunks of this many elements,
+            each in a separate subdirectory of `path`, with progress recorded in
+            `path/manifest.json`. If saving is interrupted, the next call resumes from
+            the last completed chunk rather than starting again. Resuming is only
+            consistent with an uninterrupted save if the dataset is deterministic.
+            Completed elements are skipped with `Dataset.skip`, which still runs
+            them through the input pipeline, so resuming saves the cost of writing
+            them but not of computing them. See `chunked_save_load` to avoid
+            recomputation. If None, the dataset is saved in one call and partial
+            saves are removed on failure.
+
+    Returns:
+        transform mapping dataset -> cached dataset.
+    """
 
     def transform(dataset):
         tf.io.gfile.makedirs(path)
+        if chunk_size is not None:
+            manifest = _save_chunks(
+                dataset.skip,
+                path,
+                chunk_size=chunk_size,
+                compression=compression,
+                shard_func=shard_func,
+            )
+            return _load_chunks(
+                path, manifest, dataset.element_spec, compression, reader_func
+            ).apply(tf.data.experimental.assert_cardinality(dataset.cardinality()))
+
         matching = tf.io.matching_files(path + "/*")
         if tf.shape(matching)[0] == 0:
             if tf.executing_eagerly():
@@ -43,27 +220,190 @@ def save_load_cache(
 
 
 @gin.configurable(module="kb.data")
-def tfrecords_cache(path: str, compression: Optional[str] = None):
+def chunked_save_load(
+    dataset_fn: Callable[[int], tf.data.Dataset],
+    path: str,
+    chunk_size: int,
+    compression: Optional[str] = None,
+    shard_func: Optional[Callable] = None,
+    reader_func: Optional[Callable] = None,
+) -> tf.data.Dataset:
+    """
+    Save a dataset in resumable chunks and load it.
+
+    Like `save_load_cache(chunk_size=chunk_size)`, except resumed saves start the
+    input pipeline at the first unsaved element rather than skipping completed
+    elements after they have been computed. If `dataset_fn` skips at the source
+    (e.g. `lambda start: tf.data.Dataset.range(start, n).map(expensive_fn)`),
+    resuming a save that is 90% complete costs roughly 10% of a full save.
+
+    Args:
+        dataset_fn: function mapping `start` to the dataset from element `start`
+            onwards. Must be deterministic for resumed saves to be consistent with
+            uninterrupted ones.
+        path: directory to save to / load from.
+        chunk_size: number of elements in each chunk.
+        compression: used in save/load.
+        shard_func: used in save.
+        reader_func: used in load.
+
+    Returns:
+        loaded dataset.
+    """
+    tf.io.gfile.makedirs(path)
+    element_spec = None
+
+    def wrapped_fn(start):
+        nonlocal element_spec
+        dataset = dataset_fn(start)
+        element_spec = dataset.element_spec
+        return dataset
+
+    manifest = _save_chunks(
+        wrapped_fn,
+        path,
+        chunk_size=chunk_size,
+        compression=compression,
+        shard_func=shard_func,
+    )
+    if element_spec is None:
+        # save was already complete
+        element_spec = dataset_fn(manifest["num_elements"]).element_spec
+    return _load_chunks(path, manifest, element_spec, compression, reader_func).apply(
+        tf.data.experimental.assert_cardinality(manifest["num_elements"])
+    )
+
+
+@gin.configurable(module="kb.data")
+def tfrecords_cache(
+    path: str,
+    compression: Optional[str] = None,
+    num_shards: Optional[int] = None,
+    record_format: str = "tensor",
+    block_size: Optional[int] = None,
+    num_parallel_calls: int = 1,
+    deterministic: Optional[bool] = None,
+    write_through: bool = False,
+    chunk_codec: Optional[str] = None,
+    chunk_size: int = 64,
+):
     def transform(dataset):
         return tfrecords_lib.tfrecords_cache(
-            dataset, cache_dir=path, compression=compression
+            dataset,
+            cache_dir=path,
+            compression=compression,
+            num_shards=num_shards,
+            record_format=record_format,
+            block_size=block_size,
+            num_parallel_calls=num_parallel_calls,
+            deterministic=deterministic,
+            write_through=write_through,
+            chunk_codec=chunk_codec,
+            chunk_size=chunk_size,
+        )
+
+    return transform
+
+
+@gin.configurable(module="kb.data")
+def indexed_cache(
+    path: str,
+    shuffle: bool = False,
+    seed: Optional[int] = None,
+    num_parallel_calls: int = 1,
+    deterministic: Optional[bool] = None,
+    record_format: str = "tensor",
+) -> Transform:
+    """
+    Cache transform supporting global shuffling via random access.
+
+    See `kblocks.data.indexed.indexed_cache`.
+    """
+
+    def transform(dataset):
+        return indexed_lib.indexed_cache(
+            dataset,
+            expand(path),
+            shuffle=shuffle,
+            seed=seed,
+            num_parallel_calls=num_parallel_calls,
+            deterministic=deterministic,
+            record_format=record_format,
         )
 
     return transform
 
 
+@gin.configurable(module="kb.data")
+def mmap_cache(
+    path: str, shuffle: bool = False, seed: Optional[int] = None
+) -> Transform:
+    """
+    Cache transform using a memory-mapped file of fixed-stride records.
+
+    Use a path in `/dev/shm` to share a single in-memory copy between processes on
+    the same host. See `kblocks.data.mmap.mmap_cache`.
+    """
+
+    def transform(dataset):
+        return mmap_lib.mmap_cache(dataset, expand(path), shuffle=shuffle, seed=seed)
+
+    return transform
+
+
 def _repeated_paths(path: str, num_repeats: int) -> Tuple[str, ...]:
     if num_repeats > 10000:
         raise ValueError("Can only handle up to 1e4 repeats")
     return [os.path.join(path, f"repeat-{i:04d}") for i in range(num_repeats)]
 
 
+def _build_repeats(
+    paths: Sequence[str],
+    dataset: tf.data.Dataset,
+    cache_factory: Callable[[str], Transform],
+    num_workers: int,
+) -> List[tf.data.Dataset]:
+    """
+    Get cached datasets at each path, building them using `num_workers` threads.
+
+    Caches that write files lazily (e.g. `tf.data.Dataset.cache`) are iterated to
+    completion, so all repeats are written before this function returns. Progress
+    and failures are logged for each repeat. If any repeat fails, the first error is
+    raised after all others have finished.
+    """
+    num_repeats = len(paths)
+    for path in paths:
+        tf.io.gfile.makedirs(os.path.dirname(path))
+
+    def build(i: int, path: str) -> tf.data.Dataset:
+        logging.info(f"Building repeat {i + 1} / {num_repeats} at {path}")
+        t = time.perf_counter()
+        try:
+            cached = cache_factory(path)(dataset)
+            if not tf.io.gfile.glob(f"{path}*"):
+                # nothing written yet, so iterate to write lazy caches
+                cached.reduce(0, lambda count, _: count + 1)
+        except Exception:
+            logging.error(f"Failed to build repeat {i + 1} / {num_repeats} at {path}")
+            raise
+        logging.info(
+            f"Finished repeat {i + 1} / {num_repeats} in "
+            f"{time.perf_counter() - t:.1f}s"
+        )
+        return cached
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(build, i, p) for i, p in enumerate(paths)]
+    return [future.result() for future in futures]
+
+
 @gin.configurable(module="kb.data")
 def repeated_cache(
     path: str,
     num_repeats: int,
     cache_factory: Callable[[str], Transform] = cache,
     transform: Transform = lambda x: x,
+    num_workers: int = 1,
 ) -> Transform:
     """
     Get a transform for caching multpile epochs of the underlying dataset.
@@ -72,17 +412,26 @@ def repeated_cache(
 
     The output of the return transform calls have `num_repeats` times as many elements
     the input dataset.
+
+    Args:
+        path: root directory of repeats.
+        num_repeats: number of repeats.
+        cache_factory: function mapping path to cache transform.
+        transform: transform applied to each cached repeat.
+        num_workers: number of threads used to build repeats concurrently.
+
+    Returns:
+        transform mapping dataset -> repeated cached dataset.
     """
     paths = _repeated_paths(path=path, num_repeats=num_repeats)
 
     def ret_transform(dataset):
         # possibly create cached files in eager mode
-        for p in paths:
-            cache_factory(p)(dataset)
-
-        return tf.data.Dataset.from_tensor_slices(paths).flat_map(
-            lambda p: transform(cache_factory(p)(dataset))
-        )
+        datasets = [
+            transform(cached)
+            for cached in _build_repeats(paths, dataset, cache_factory, num_workers)
+        ]
+        return functools.reduce(lambda a, b: a.concatenate(b), datasets)
 
     return ret_transform
 
@@ -95,6 +444,7 @@ def random_repeated_cache(
     shuffle_seed: Optional[int] = None,
     reshuffle_each_iteration: bool = True,
     transform: Transform = lambda x: x,
+    num_workers: int = 1,
 ) -> Transform:
     """
     Get a transform for caching multiple epochs of the underlying dataset.
@@ -103,20 +453,160 @@ def random_repeated_cache(
 
     Each iteration returns a random repeat. The output of the returned transform calls
     have the same number of elements as the input dataset.
+
+    Args:
+        path: root directory of repeats.
+        num_repeats: number of repeats.
+        cache_factory: function mapping path to cache transform.
+        shuffle_seed: seed used to select repeats.
+        reshuffle_each_iteration: if False, the same repeat is used each iteration.
+        transform: transform applied to the selected repeat.
+        num_workers: number of threads used to build repeats concurrently.
+
+    Returns:
+        transform mapping dataset -> cached dataset.
     """
     paths = _repeated_paths(path=path, num_repeats=num_repeats)
 
     def ret_transform(dataset):
+        cardinality = metadata.cardinality(dataset)
         # possibly create cached files in eager mode
-        for p in paths:
-            cache_factory(p)(dataset)
-        path_dataset = tf.data.Dataset.from_tensor_slices(path).shuffle(
-            len(paths),
-            seed=shuffle_seed,
-            reshuffle_each_iteration=reshuffle_each_iteration,
-        )
-        return transform(
-            path_dataset.take(1).flat_map(lambda p: cache_factory(p)(dataset))
+        datasets = _build_repeats(paths, dataset, cache_factory, num_workers)
+
+        def select(index):
+            # only the selected repeat is iterated, and it is iterated to the end
+            return functools.reduce(
+                lambda a, b: a.concatenate(b),
+                [
+                    tf.data.Dataset.from_tensors(index)
+                    .filter(lambda i, j=j: tf.equal(i, j))
+                    .flat_map(lambda _, ds=ds: ds)
+                    for j, ds in enumerate(datasets)
+                ],
+            )
+
+        selected = (
+            tf.data.Dataset.range(num_repeats)
+            .shuffle(
+                num_repeats,
+                seed=shuffle_seed,
+                reshuffle_each_iteration=reshuffle_each_iteration,
+            )
+            .take(1)
+            .flat_map(select)
         )
+        if cardinality >= 0:
+            selected = selected.apply(
+                tf.data.experimental.assert_cardinality(cardinality)
+            )
+        return transform(selected)
 
     return ret_transform
+
+
+@gin.configurable(module="kb.data")
+def content_addressed_cache(
+    cache_root: str,
+    cache_factory: Callable[[str], Transform] = cache,
+    configurables: Iterable[Union[str, Callable]] = (),
+) -> Transform:
+    """
+    Get a cache transform with path determined by the dataset being cached.
+
+    The cache path is `{cache_root}/{key}`, where `key` is based on the input
+    dataset's `element_spec` and graph, the gin bindings of `configurables` and
+    `cache_factory` (including any gin bindings or `functools.partial` arguments).
+    Changes to upstream map functions result in a new key, while identical pipelines
+    from different experiments share the same cache.
+
+    Stale caches are not removed.
+
+    Args:
+        cache_root: root directory for all caches.
+        cache_factory: function mapping path to cache transform, e.g. `cache`,
+            `save_load_cache` or `tfrecords_cache`.
+        configurables: names of gin configurables (or configurable functions) that
+            affect the dataset in ways not captured by the graph, e.g. python code
+            run in `tf.data.Dataset.from_generator` or pre-processing steps that write
+            files.
+
+    Returns:
+        cache transform.
+    """
+    cache_root = expand(cache_root)
+    configurables = tuple(configurables)
+
+    def transform(dataset):
+        key = fingerprint_lib.fingerprint(
+            dataset,
+            configurables=configurables,
+            extra=(fingerprint_lib.callable_key(cache_factory),),
+        )
+        path = os.path.join(cache_root, key)
+        logging.info(f"Using cache at {path}")
+        tf.io.gfile.makedirs(cache_root)
+        return cache_factory(path)(dataset)
+
+    return transform
+
+
+@gin.configurable(module="kb.data")
+def managed_cache(
+    cache_root: str,
+    name: Optional[str] = None,
+    cache_factory: Callable[[str], Transform] = cache,
+    quota_bytes: Optional[int] = None,
+    pinned: bool = False,
+    config: Optional[str] = None,
+) -> Transform:
+    """
+    Get a cache transform with size accounting and LRU eviction in `cache_root`.
+
+    Least recently used caches in `cache_root` are removed before and after the cache
+    is created to keep total size below `quota_bytes`. Pinned caches and caches in use
+    by any process are never removed. See `kblocks.data.manager.CacheManager`.
+
+    The cache is written at `{cache_root}/{name}/data`, so factories writing files
+    with `data` as a prefix (e.g. `cache`) and those writing a `data` directory (e.g.
+    `tfrecords_cache`) are both contained in the managed directory. Lazy caches are
+    iterated once so the recorded size reflects the written cache.
+
+    Args:
+        cache_root: root directory of all managed caches.
+        name: name of the cache, i.e. subdirectory of `cache_root`. If None, a
+            content-based key is used (see `content_addressed_cache`).
+        cache_factory: function mapping path to cache transform.
+        quota_bytes: maximum total size of caches in `cache_root`.
+        pinned: if True, this cache is never evicted.
+        config: description of config producing the cache stored in metadata.
+            Defaults to `gin.config_str()`.
+
+    Returns:
+        cache transform.
+    """
+    cache_root = expand(cache_root)
+
+    def transform(dataset):
+        manager = manager_lib.CacheManager(cache_root, quota_bytes=quota_bytes)
+        cache_name = name
+        if cache_name is None:
+            cache_name = fingerprint_lib.fingerprint(
+                dataset, extra=(fingerprint_lib.callable_key(cache_factory),)
+            )
+        path = manager.acquire(
+            cache_name,
+            config=gin.config_str() if config is None else config,
+            pinned=pinned,
+        )
+        manager.prune()
+        tf.io.gfile.makedirs(path)
+        data_path = os.path.join(path, "data")
+        cached = cache_factory(data_path)(dataset)
+        if not tf.io.gfile.glob(f"{data_path}*"):
+            # nothing written yet, so iterate to write lazy caches before sizing
+            cached.reduce(0, lambda count, _: count + 1)
+        manager.update_size(cache_name)
+        manager.prune()
+        return cached
+
+    return transform
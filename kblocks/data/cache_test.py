@@ -1,3 +1,4 @@
+import functools
 import os
 import tempfile
 
@@ -6,7 +7,15 @@ import tensorflow as tf
 from absl.testing import parameterized
 
 from kblocks.data import cache, snapshot
-from kblocks.data.cache import save_load_cache, tfrecords_cache
+from kblocks.data.cache import (
+    chunked_save_load,
+    indexed_cache,
+    mmap_cache,
+    random_repeated_cache,
+    repeated_cache,
+    save_load_cache,
+    tfrecords_cache,
+)
 
 os.environ["TF_DETERMINISTIC_OPS"] = "1"
 
@@ -18,11 +27,22 @@ def as_array(dataset: tf.data.Dataset) -> np.ndarray:
 lazy_factories = (
     cache,
     snapshot,
+    functools.partial(tfrecords_cache, write_through=True),
+    functools.partial(tfrecords_cache, write_through=True, record_format="flat"),
 )
 
 eager_factories = (
     tfrecords_cache,
+    functools.partial(tfrecords_cache, num_shards=3),
+    functools.partial(tfrecords_cache, record_format="flat"),
+    functools.partial(tfrecords_cache, record_format="flat", block_size=2),
+    functools.partial(tfrecords_cache, chunk_codec="ZLIB", chunk_size=2),
+    functools.partial(tfrecords_cache, chunk_codec="GZIP", num_shards=2),
     save_load_cache,
+    functools.partial(save_load_cache, chunk_size=2),
+    lambda path: mmap_cache(os.path.join(path, "records")),
+    indexed_cache,
+    functools.partial(indexed_cache, record_format="flat"),
 )
 
 factories = lazy_factories + eager_factories
@@ -51,6 +71,111 @@ class CacheTest(tf.test.TestCase, parameterized.TestCase):
                 np.testing.assert_equal(as_array(cached), expected)
                 np.testing.assert_equal(rng.state.numpy(), state)
 
+    def test_save_load_cache_resume(self):
+        def failing_map(x):
+            with tf.control_dependencies(
+                [tf.debugging.assert_less(x, tf.constant(3, tf.int64))]
+            ):
+                return x + 10
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            transform = save_load_cache(tmp_dir, chunk_size=2)
+            with self.assertRaises(tf.errors.InvalidArgumentError):
+                tf.data.Dataset.range(5).map(failing_map).apply(transform)
+            # first chunk is kept, remaining elements come from the new dataset
+            cached = tf.data.Dataset.range(5).apply(transform)
+            np.testing.assert_equal(as_array(cached), [10, 11, 2, 3, 4])
+            np.testing.assert_equal(cached.cardinality().numpy(), 5)
+
+    def test_chunked_save_load_resume(self):
+        calls = []
+
+        def expensive(x):
+            calls.append(int(x))
+            return x + 10
+
+        def dataset_fn(start, limit=None):
+            def map_fn(x):
+                x = tf.numpy_function(expensive, [x], tf.int64, stateful=True)
+                x = tf.ensure_shape(x, ())
+                if limit is not None:
+                    with tf.control_dependencies(
+                        [tf.debugging.assert_less(x, tf.constant(limit, tf.int64))]
+                    ):
+                        x = tf.identity(x)
+                return x
+
+            return tf.data.Dataset.range(start, 10).map(map_fn)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.assertRaises(tf.errors.InvalidArgumentError):
+                chunked_save_load(
+                    functools.partial(dataset_fn, limit=16), tmp_dir, chunk_size=2
+                )
+            # chunks [10, 11], [12, 13], [14, 15] are complete
+            del calls[:]
+            cached = chunked_save_load(dataset_fn, tmp_dir, chunk_size=2)
+            self.assertEqual(calls, [6, 7, 8, 9])
+            np.testing.assert_equal(as_array(cached), np.arange(10, 20))
+            np.testing.assert_equal(cached.cardinality().numpy(), 10)
+
+    @parameterized.parameters(cache, tfrecords_cache)
+    def test_repeated_cache(self, factory):
+        num_repeats = 4
+        epoch_length = 5
+        rng = tf.random.Generator.from_seed(0)
+        dataset = tf.data.Dataset.range(epoch_length).map(
+            lambda x: tf.cast(x, tf.float32) + rng.uniform(())
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = dataset.apply(
+                repeated_cache(
+                    tmp_dir,
+                    num_repeats=num_repeats,
+                    cache_factory=factory,
+                    num_workers=2,
+                )
+            )
+            values = as_array(cached)
+            self.assertEqual(values.shape, (num_repeats * epoch_length,))
+            np.testing.assert_equal(as_array(cached), values)
+
+    @parameterized.parameters(cache, tfrecords_cache)
+    def test_random_repeated_cache(self, factory):
+        num_repeats = 4
+        epoch_length = 5
+        rng = tf.random.Generator.from_seed(0)
+        dataset = tf.data.Dataset.range(epoch_length).map(
+            lambda x: tf.cast(x, tf.float32) + rng.uniform(())
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            transform = random_repeated_cache(
+                tmp_dir,
+                num_repeats=num_repeats,
+                cache_factory=factory,
+                reshuffle_each_iteration=False,
+                num_workers=2,
+            )
+            random_cached = dataset.apply(transform)
+            # all repeats are written before iterating
+            for i in range(num_repeats):
+                self.assertNotEmpty(
+                    tf.io.gfile.glob(os.path.join(tmp_dir, f"repeat-{i:04d}*"))
+                )
+            state = rng.state.numpy()
+            values = as_array(random_cached)
+            self.assertEqual(values.shape, (epoch_length,))
+            np.testing.assert_equal(as_array(random_cached), values)
+            # augmentation is not re-run, including when applied again
+            as_array(dataset.apply(transform))
+            np.testing.assert_equal(rng.state.numpy(), state)
+
+    def test_random_repeated_cache_unknown_cardinality(self):
+        dataset = tf.data.Dataset.range(10).filter(lambda x: x % 2 == 0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = dataset.apply(random_repeated_cache(tmp_dir, num_repeats=2))
+            np.testing.assert_equal(as_array(cached), [0, 2, 4, 6, 8])
+
 
 if __name__ == "__main__":
     tf.test.main()
@@ -28,6 +28,9 @@ def batch(batch_size: int, drop_remainder: bool = False) -> Transform:
     def transform(dataset: tf.data.Dataset):
         return dataset.batch(batch_size, drop_remainder=drop_remainder)
 
+    # used in `kblocks.data.optimize`
+    transform.batch_size = batch_size
+    transform.drop_remainder = drop_remainder
     return transform
 
 
@@ -76,7 +79,14 @@ def map_transform(
     map_func: Callable,
     num_parallel_calls: Optional[int] = None,
     deterministic: Optional[bool] = None,
+    vectorizable: bool = False,
 ) -> Transform:
+    """
+    `vectorizable` maps may be applied after batching by
+    `kblocks.data.optimize.fuse_vectorized_maps`. Only set it if `map_func` gives the
+    same results applied to batched elements as it does to individual elements.
+    """
+
     def transform(dataset):
         return dataset.map(
             map_func=map_func,
@@ -84,6 +94,9 @@ def map_transform(
             deterministic=deterministic,
         )
 
+    # used in `kblocks.data.optimize`
+    transform.map_func = map_func
+    transform.vectorizable = vectorizable
     return transform
 
 
@@ -0,0 +1,119 @@
+"""Content-based keys for caching datasets."""
+import functools
+import hashlib
+from typing import Callable, Iterable, Union
+
+import gin
+import tensorflow as tf
+
+
+def _rename_funcs(attr_values, names: Callable[[str], str]):
+    for value in attr_values:
+        if value.HasField("func"):
+            value.func.name = names(value.func.name)
+            _rename_funcs(value.func.attr.values(), names)
+        for func in value.list.func:
+            func.name = names(func.name)
+            _rename_funcs(func.attr.values(), names)
+
+
+def _canonical_nodes(nodes, names: Callable[[str], str]):
+    for node in nodes:
+        node.op = names(node.op)
+        # dataset metadata contains process-specific unique names, and python
+        # function tokens (e.g. "pyfunc_3") depend on creation order
+        for attr in ("metadata", "token"):
+            if attr in node.attr:
+                del node.attr[attr]
+        _rename_funcs(node.attr.values(), names)
+
+
+def graph_fingerprint(dataset: tf.data.Dataset) -> str:
+    """
+    Get a hash of the graph of `dataset`.
+
+    Functions are renamed based on a hash of their content, so fingerprints are
+    consistent between datasets built in different processes or in a different
+    order. Must be run in eager mode.
+
+    Python functions (`tf.py_function`, `tf.numpy_function`, `from_generator`) are
+    not part of the graph, so pipelines differing only in python functions with the
+    same signatures have the same fingerprint. Use `fingerprint`'s `extra` to
+    distinguish them.
+    """
+    graph_def = tf.compat.v1.GraphDef.FromString(
+        dataset._as_serialized_graph(  # pylint: disable=protected-access
+            strip_device_assignment=True
+        ).numpy()
+    )
+    functions = {f.signature.name: f for f in graph_def.library.function}
+
+    @functools.lru_cache(maxsize=None)
+    def canonical_name(name: str) -> str:
+        if name not in functions:
+            return name  # op name
+        func = functions[name]
+        func.signature.name = ""
+        _canonical_nodes(func.node_def, canonical_name)
+        return hashlib.sha256(func.SerializeToString(deterministic=True)).hexdigest()
+
+    _canonical_nodes(graph_def.node, canonical_name)
+    del graph_def.library.function[:]
+    return hashlib.sha256(graph_def.SerializeToString(deterministic=True)).hexdigest()
+
+
+def _bindings_str(configurable: Union[str, Callable]) -> str:
+    try:
+        bindings = gin.get_bindings(configurable)
+    except ValueError:
+        # not registered with gin
+        bindings = {}
+    return repr(sorted(bindings.items()))
+
+
+def fingerprint(
+    dataset: tf.data.Dataset,
+    configurables: Iterable[Union[str, Callable]] = (),
+    extra: Iterable[str] = (),
+) -> str:
+    """
+    Get a key based on the contents of `dataset`.
+
+    Args:
+        dataset: dataset to fingerprint.
+        configurables: names of gin configurables (or configurable functions) whose
+            bindings are included.
+        extra: additional strings to include.
+
+    Returns:
+        hex string based on `dataset.element_spec`, `graph_fingerprint(dataset)`,
+        `configurables` bindings and `extra`.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(repr(dataset.element_spec).encode())
+    hasher.update(graph_fingerprint(dataset).encode())
+    for configurable in configurables:
+        hasher.update(_bindings_str(configurable).encode())
+    for e in extra:
+        hasher.update(e.encode())
+    return hasher.hexdigest()
+
+
+def callable_key(func: Callable) -> str:
+    """
+    Get a string identifying `func` including any partial arguments or gin bindings.
+
+    Used to distinguish between different cache factories.
+    """
+    if isinstance(func, functools.partial):
+        return repr(
+            (
+                callable_key(func.func),
+                tuple(repr(arg) for arg in func.args),
+                sorted((k, repr(v)) for k, v in func.keywords.items()),
+            )
+        )
+    name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', '')}"
+    if name == ".":
+        name = type(func).__qualname__
+    return f"{name}:{_bindings_str(func)}"
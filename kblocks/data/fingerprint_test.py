@@ -0,0 +1,100 @@
+import functools
+import os
+import subprocess
+import sys
+import tempfile
+
+import gin
+import tensorflow as tf
+
+from kblocks.data.cache import content_addressed_cache, tfrecords_cache
+from kblocks.data.fingerprint import callable_key, fingerprint
+
+
+def get_dataset(n: int = 10, scale: int = 2):
+    return (
+        tf.data.Dataset.range(n)
+        .map(lambda x: x * scale)
+        .batch(2)
+        .map(lambda x: tf.data.Dataset.from_tensor_slices(x).reduce(x[0], tf.add))
+    )
+
+
+class FingerprintTest(tf.test.TestCase):
+    def test_fingerprint(self):
+        key = fingerprint(get_dataset())
+        self.assertEqual(key, fingerprint(get_dataset()))
+        self.assertNotEqual(key, fingerprint(get_dataset(n=11)))
+        self.assertNotEqual(key, fingerprint(get_dataset(scale=3)))
+        self.assertNotEqual(key, fingerprint(get_dataset(), extra=("foo",)))
+
+    def test_numpy_function_consistent_between_processes(self):
+        script = """
+import sys
+import tensorflow as tf
+from kblocks.data.fingerprint import fingerprint
+
+for _ in range(int(sys.argv[1])):
+    # extra python function created first
+    tf.data.Dataset.range(1).map(
+        lambda x: tf.numpy_function(lambda x: x, [x], tf.int64)
+    )
+dataset = tf.data.Dataset.range(5).map(
+    lambda x: tf.numpy_function(lambda x: x + 1, [x], tf.int64)
+)
+print(fingerprint(dataset))
+"""
+
+        def key(num_extra: int) -> str:
+            return (
+                subprocess.run(
+                    [sys.executable, "-c", script, str(num_extra)],
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    universal_newlines=True,
+                )
+                .stdout.strip()
+                .split("\n")[-1]
+            )
+
+        self.assertEqual(key(0), key(1))
+
+    def test_configurables(self):
+        key = fingerprint(get_dataset(), configurables=["kb.data.tfrecords_cache"])
+        with gin.unlock_config():
+            gin.bind_parameter("kb.data.tfrecords_cache.num_shards", 2)
+        try:
+            self.assertNotEqual(
+                key,
+                fingerprint(get_dataset(), configurables=["kb.data.tfrecords_cache"]),
+            )
+        finally:
+            gin.clear_config()
+
+    def test_callable_key(self):
+        self.assertEqual(callable_key(tfrecords_cache), callable_key(tfrecords_cache))
+        self.assertNotEqual(
+            callable_key(tfrecords_cache),
+            callable_key(functools.partial(tfrecords_cache, num_shards=2)),
+        )
+
+    def test_content_addressed_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            transform = content_addressed_cache(tmp_dir, tfrecords_cache)
+            expected = list(get_dataset().as_numpy_iterator())
+            self.assertEqual(
+                list(get_dataset().apply(transform).as_numpy_iterator()), expected
+            )
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+            # identical pipeline shares cache
+            self.assertEqual(
+                list(get_dataset().apply(transform).as_numpy_iterator()), expected
+            )
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+            # modified pipeline gets a new cache
+            get_dataset(scale=3).apply(transform)
+            self.assertEqual(len(os.listdir(tmp_dir)), 2)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,176 @@
+"""
+Indexed caches supporting random access to serialized records.
+
+Records are stored contiguously in a single data file, with an offsets table giving
+the start of each record. Global shuffling then only requires a permutation of
+`num_elements` indices rather than a buffer of full elements.
+"""
+import fcntl
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+from absl import logging
+
+from kblocks.data import tfrecords
+
+DATA_FILENAME = "records.bin"
+OFFSETS_FILENAME = "offsets.npy"
+LOCK_FILENAME = "records.lock"
+
+
+def _paths(cache_dir: str) -> Tuple[str, str]:
+    return (
+        os.path.join(cache_dir, DATA_FILENAME),
+        os.path.join(cache_dir, OFFSETS_FILENAME),
+    )
+
+
+def save(dataset: tf.data.Dataset, cache_dir: str, record_format: str = "tensor"):
+    """
+    Save `dataset` as serialized records with an offsets table.
+
+    The offsets table is written last, so caches with offsets are complete. Saving is
+    guarded by a file lock, so concurrent processes saving to the same `cache_dir`
+    wait for the first to finish rather than writing their own. Does nothing if the
+    cache is already complete.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LOCK_FILENAME), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not is_complete(cache_dir):
+                _save(dataset, cache_dir, record_format)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _save(dataset: tf.data.Dataset, cache_dir: str, record_format: str):
+    data_path, offsets_path = _paths(cache_dir)
+    tmp_path = f"{data_path}.tmp"
+    serialized = dataset.map(
+        tfrecords.record_serializer(dataset.element_spec, record_format),
+        num_parallel_calls=tf.data.experimental.AUTOTUNE,
+    )
+    offsets = [0]
+    with open(tmp_path, "wb") as fp:
+        for record in serialized.as_numpy_iterator():
+            fp.write(record)
+            offsets.append(offsets[-1] + len(record))
+    os.rename(tmp_path, data_path)
+    np.save(f"{offsets_path}.tmp.npy", np.array(offsets, dtype=np.int64))
+    os.rename(f"{offsets_path}.tmp.npy", offsets_path)
+
+
+def is_complete(cache_dir: str) -> bool:
+    return all(os.path.exists(p) for p in _paths(cache_dir))
+
+
+def indexed_cache(
+    dataset: tf.data.Dataset,
+    cache_dir: str,
+    shuffle: bool = False,
+    seed: Optional[int] = None,
+    num_parallel_calls: int = 1,
+    deterministic: Optional[bool] = None,
+    record_format: str = "tensor",
+) -> tf.data.Dataset:
+    """
+    Cache `dataset` in an indexed file supporting random access.
+
+    Unlike `tf.data.Dataset.shuffle`, shuffling is a true permutation of the entire
+    epoch, requires memory for `num_elements` indices rather than a buffer of
+    elements and has no warm-up.
+
+    Args:
+        dataset: finite dataset to cache.
+        cache_dir: directory to save files in. Files are written if missing.
+        shuffle: if True, each epoch is a uniformly random permutation of the cached
+            elements.
+        seed: op seed used for permutations. Permutations differ between epochs
+            when the returned dataset is repeated, but each new iterator gives the
+            same sequence.
+        num_parallel_calls: used in reading and deserialization.
+        deterministic: used in reading and deserialization.
+        record_format: one of `tfrecords.RECORD_FORMATS`.
+
+    Returns:
+        dataset with the same elements as `dataset` (possibly permuted).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    if not is_complete(cache_dir):
+        logging.info(f"Saving indexed dataset to {cache_dir}")
+        save(dataset, cache_dir, record_format=record_format)
+    num_elements = num_records(cache_dir)
+    indices = tf.data.Dataset.range(num_elements)
+    if shuffle:
+        indices = tf.data.Dataset.from_tensors(tf.constant(num_elements, tf.int64))
+        indices = indices.flat_map(
+            lambda n: tf.data.Dataset.from_tensor_slices(
+                tf.random.shuffle(tf.range(n), seed=seed)
+            )
+        )
+    return read(
+        indices,
+        cache_dir,
+        spec=dataset.element_spec,
+        num_parallel_calls=num_parallel_calls,
+        deterministic=deterministic,
+        record_format=record_format,
+    ).apply(tf.data.experimental.assert_cardinality(num_elements))
+
+
+def num_records(cache_dir: str) -> int:
+    """Get the number of records in a complete indexed cache."""
+    return np.load(_paths(cache_dir)[1], mmap_mode="r").size - 1
+
+
+def read(
+    indices: tf.data.Dataset,
+    cache_dir: str,
+    spec,
+    num_parallel_calls: int = 1,
+    deterministic: Optional[bool] = None,
+    record_format: str = "tensor",
+) -> tf.data.Dataset:
+    """
+    Read elements of a complete indexed cache.
+
+    Args:
+        indices: dataset of int64 scalar record indices.
+        cache_dir: directory of the cache.
+        spec: element spec of the cached dataset.
+        num_parallel_calls: used in reading and deserialization.
+        deterministic: used in reading and deserialization.
+        record_format: one of `tfrecords.RECORD_FORMATS` used when saving.
+
+    Returns:
+        dataset with the elements at `indices`.
+    """
+    data_path, offsets_path = _paths(cache_dir)
+    offsets = np.load(offsets_path)
+    data = (
+        np.memmap(data_path, dtype=np.uint8, mode="r")
+        if offsets[-1] > 0
+        else np.zeros((0,), np.uint8)  # empty files can't be mapped
+    )
+
+    def read_record(index):
+        return data[offsets[index] : offsets[index + 1]].tobytes()
+
+    def map_func(index):
+        record = tf.numpy_function(read_record, (index,), tf.string)
+        record.set_shape(())
+        return record
+
+    records = indices.map(
+        map_func, num_parallel_calls=num_parallel_calls, deterministic=deterministic
+    )
+    return tfrecords.parse(
+        records,
+        spec=spec,
+        num_parallel_calls=num_parallel_calls,
+        deterministic=deterministic,
+        record_format=record_format,
+    )
@@ -0,0 +1,62 @@
+import tempfile
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from kblocks.data import indexed
+
+
+class IndexedTest(tf.test.TestCase):
+    def test_indexed_cache(self):
+        dataset = tf.data.Dataset.range(10).map(
+            lambda x: (tf.range(x), {"y": tf.cast(x, tf.float32)})
+        )
+        expected = list(dataset.as_numpy_iterator())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = indexed.indexed_cache(dataset, tmp_dir)
+            np.testing.assert_equal(cached.cardinality().numpy(), 10)
+            np.testing.assert_equal(list(cached.as_numpy_iterator()), expected)
+
+    def test_shuffle(self):
+        dataset = tf.data.Dataset.range(20)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = indexed.indexed_cache(
+                dataset, tmp_dir, shuffle=True, seed=0, record_format="flat"
+            )
+            epochs = np.reshape(list(cached.repeat(2).as_numpy_iterator()), (2, 20))
+            for epoch in epochs:
+                np.testing.assert_equal(np.sort(epoch), np.arange(20))
+                self.assertFalse(np.all(epoch == np.arange(20)))
+            self.assertFalse(np.all(epochs[0] == epochs[1]))
+
+    def test_concurrent_save(self):
+        calls = []
+
+        def record_call(x):
+            calls.append(int(x))
+            return x
+
+        dataset = tf.data.Dataset.range(10).map(
+            lambda x: tf.ensure_shape(
+                tf.numpy_function(record_call, [x], tf.int64, stateful=True), ()
+            )
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            threads = [
+                threading.Thread(target=indexed.save, args=(dataset, tmp_dir))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # second save waits for the first and finds the cache complete
+            self.assertEqual(sorted(calls), list(range(10)))
+            indices = tf.data.Dataset.range(indexed.num_records(tmp_dir))
+            cached = indexed.read(indices, tmp_dir, dataset.element_spec)
+            np.testing.assert_equal(list(cached.as_numpy_iterator()), np.arange(10))
+
+
+if __name__ == "__main__":
+    tf.test.main()
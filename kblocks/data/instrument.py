@@ -0,0 +1,202 @@
+"""
+Opt-in per-stage instrumentation of transform pipelines.
+
+Taps are inserted between each transform of a pipeline. Each tap records the number
+and arrival times of elements passing through it. From these, `PipelineStats`
+estimates per-stage throughput, time spent waiting on upstream stages, time spent in
+each stage and the number of elements in flight (e.g. in prefetch buffers).
+
+Taps run a python function per element, so instrumentation adds overhead and should
+only be used for diagnosis.
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import gin
+import numpy as np
+import tensorflow as tf
+from absl import logging
+
+from kblocks.data.core import Transform
+
+
+class _Tap:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.first_time = None
+            self.last_time = None
+            self.total_gap = 0.0
+
+    def record(self) -> float:
+        now = time.perf_counter()
+        with self._lock:
+            if self.last_time is None:
+                self.first_time = now
+            else:
+                self.total_gap += now - self.last_time
+            self.last_time = now
+            self.count += 1
+            self.total += 1
+        return now
+
+
+class _Stage:
+    def __init__(self, name: str, input_tap: _Tap, output_tap: _Tap):
+        self.name = name
+        self.input_tap = input_tap
+        self.output_tap = output_tap
+        self.reset()
+
+    def reset(self):
+        self.stage_time = 0.0
+
+    def on_output(self, now: float):
+        last_input = self.input_tap.last_time
+        if last_input is not None:
+            self.stage_time += now - last_input
+
+
+def _stage_name(transform: Callable) -> str:
+    # transforms are usually closures, e.g. `batch.<locals>.transform`
+    name = getattr(transform, "__qualname__", type(transform).__name__)
+    return name.split(".<locals>")[0]
+
+
+class PipelineStats:
+    """
+    Statistics for an instrumented pipeline.
+
+    For each stage, `summary` reports:
+        elements: number of elements output since the last reset.
+        elements_per_sec: output throughput.
+        upstream_wait_ms: mean time between consecutive inputs, i.e. the time the
+            stage waits for each element from upstream.
+        stage_ms: mean time between a stage's most recent input and each output, i.e.
+            time attributable to the stage (including time in output buffers).
+        in_flight: total inputs minus total outputs. For one-to-one stages like maps
+            and prefetches this is the number of elements being processed or
+            buffered.
+    """
+
+    def __init__(self):
+        self._taps: List[_Tap] = []
+        self._stages: List[_Stage] = []
+
+    def _tap(self, dataset: tf.data.Dataset, tap: _Tap, stage: Optional[_Stage]):
+        def record():
+            now = tap.record()
+            if stage is not None:
+                stage.on_output(now)
+            return np.int64(tap.total)
+
+        def map_func(*args):
+            element = args[0] if len(args) == 1 else args
+            count = tf.numpy_function(record, (), tf.int64)
+            with tf.control_dependencies([count]):
+                return tf.nest.map_structure(
+                    tf.identity, element, expand_composites=True
+                )
+
+        return dataset.map(map_func)
+
+    def instrument(self, transforms: Iterable[Optional[Transform]]) -> Transform:
+        """Get a transform applying `transforms` with taps between each."""
+        transforms = [t for t in transforms if t is not None]
+
+        def transform(dataset):
+            input_tap = _Tap()
+            self._taps.append(input_tap)
+            dataset = self._tap(dataset, input_tap, None)
+            for t in transforms:
+                output_tap = _Tap()
+                self._taps.append(output_tap)
+                stage = _Stage(
+                    f"{len(self._stages):02d}-{_stage_name(t)}", input_tap, output_tap
+                )
+                self._stages.append(stage)
+                dataset = self._tap(t(dataset), output_tap, stage)
+                input_tap = output_tap
+            return dataset
+
+        return transform
+
+    def reset(self):
+        """Reset windowed statistics. `in_flight` is unaffected."""
+        for tap in self._taps:
+            tap.reset()
+        for stage in self._stages:
+            stage.reset()
+
+    def summary(self, reset: bool = False) -> Dict[str, Dict[str, float]]:
+        """Get statistics for each stage. See class docstring."""
+        summary = {}
+        for stage in self._stages:
+            inp = stage.input_tap
+            out = stage.output_tap
+            duration = out.last_time - out.first_time if out.count > 1 else float("nan")
+            summary[stage.name] = dict(
+                elements=out.count,
+                elements_per_sec=(out.count - 1) / duration if out.count > 1 else 0.0,
+                upstream_wait_ms=1000 * inp.total_gap / max(inp.count - 1, 1),
+                stage_ms=1000 * stage.stage_time / max(out.count, 1),
+                in_flight=inp.total - out.total,
+            )
+        if reset:
+            self.reset()
+        return summary
+
+    def log(self, print_fn: Callable[[str], None] = logging.info, reset: bool = False):
+        """Print a table of `summary` results."""
+        summary = self.summary(reset=reset)
+        if not summary:
+            return
+        keys = ("elements", "elements_per_sec", "upstream_wait_ms", "stage_ms")
+        name_len = max(len(name) for name in summary)
+        lines = [
+            " ".join([" " * name_len] + [k.rjust(17) for k in keys] + ["in_flight"])
+        ]
+        for name, stats in summary.items():
+            lines.append(
+                " ".join(
+                    [name.ljust(name_len)]
+                    + [f"{stats[k]:17.3f}" for k in keys]
+                    + [f"{stats['in_flight']:9d}"]
+                )
+            )
+        print_fn("\n".join(lines))
+
+    def write_scalars(self, step: int, reset: bool = False, prefix: str = "pipeline"):
+        """Write `summary` results with `tf.summary.scalar` to the default writer."""
+        for name, stats in self.summary(reset=reset).items():
+            for key, value in stats.items():
+                tf.summary.scalar(f"{prefix}/{name}/{key}", value, step=step)
+
+
+_stats: Dict[str, PipelineStats] = {}
+
+
+@gin.configurable(module="kb.data")
+def get_pipeline_stats(name: str = "default") -> PipelineStats:
+    """Get the `PipelineStats` associated with `name`, creating it if necessary."""
+    if name not in _stats:
+        _stats[name] = PipelineStats()
+    return _stats[name]
+
+
+@gin.configurable(module="kb.data")
+def instrumented_transform(
+    transforms: Iterable[Optional[Transform]], stats_name: str = "default"
+) -> Transform:
+    """
+    Instrumented equivalent of `compound_transform`.
+
+    Statistics are accumulated in `get_pipeline_stats(stats_name)`.
+    """
+    return get_pipeline_stats(stats_name).instrument(transforms)
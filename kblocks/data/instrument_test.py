@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+import tensorflow as tf
+
+from kblocks.data import core
+from kblocks.data.instrument import PipelineStats
+
+
+class InstrumentTest(tf.test.TestCase):
+    def test_instrument(self):
+        stats = PipelineStats()
+        transform = stats.instrument(
+            [
+                core.map_transform(lambda x: x * 2),
+                None,
+                core.batch(4),
+                core.prefetch(2),
+            ]
+        )
+        dataset = tf.data.Dataset.range(20).apply(transform)
+        self.assertEqual(
+            [x.tolist() for x in dataset.as_numpy_iterator()],
+            [list(range(2 * i, 2 * i + 8, 2)) for i in range(0, 20, 4)],
+        )
+        summary = stats.summary()
+        self.assertEqual(list(summary), ["00-map_transform", "01-batch", "02-prefetch"])
+        self.assertEqual(
+            [s["elements"] for s in summary.values()],
+            [20, 5, 5],
+        )
+        self.assertEqual(summary["00-map_transform"]["in_flight"], 0)
+        self.assertEqual(summary["02-prefetch"]["in_flight"], 0)
+        for s in summary.values():
+            self.assertGreater(s["elements_per_sec"], 0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with tf.summary.create_file_writer(tmp_dir).as_default():
+                stats.write_scalars(step=0)
+            self.assertNotEmpty(os.listdir(tmp_dir))
+        stats.log(reset=True)
+        self.assertEqual(stats.summary()["01-batch"]["elements"], 0)
+
+
+if __name__ == "__main__":
+    tf.test.main()
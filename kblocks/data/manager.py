@@ -0,0 +1,303 @@
+"""
+Size accounting, quotas and LRU eviction for caches in a shared root directory.
+
+Each cache is a subdirectory of the root. Metadata (size, last access time, config
+and whether the cache is pinned) is stored in a single json file in the root,
+guarded by a file lock. Processes using a cache hold a shared lock on it for the
+lifetime of the process, and caches are only removed if an exclusive lock can be
+acquired, so caches are never removed from under active readers.
+
+Example usage:
+```bash
+python -m kblocks.data.manager list --root=/ssd/caches
+python -m kblocks.data.manager prune --root=/ssd/caches --quota_gb=500
+python -m kblocks.data.manager pin --root=/ssd/caches my_cache
+```
+"""
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from absl import app, flags, logging
+
+from kblocks.utils import write_json
+
+METADATA_FILENAME = "cache-metadata.json"
+LOCK_FILENAME = ".lock"
+
+# shared locks held by this process, keyed by cache path
+_held_locks = {}
+
+
+def dir_size(path: str) -> int:
+    """Get the total size in bytes of files in `path` and its subdirectories."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except FileNotFoundError:
+                pass  # removed while walking
+    return size
+
+
+def _open_locked(path: str, operation: int):
+    """
+    Open `path` and lock it with `fcntl.flock(file, operation)`.
+
+    Lock files are removed along with their caches, so a lock may be acquired on a
+    file that has since been unlinked. Such locks would not exclude processes that
+    open the new file at `path`, so we retry until the locked file is the one at
+    `path`.
+
+    Raises:
+        BlockingIOError: if `operation` includes `LOCK_NB` and the lock is held.
+    """
+    while True:
+        lock = open(path, "a")
+        try:
+            fcntl.flock(lock, operation)
+        except BlockingIOError:
+            lock.close()
+            raise
+        try:
+            if os.fstat(lock.fileno()).st_ino == os.stat(path).st_ino:
+                return lock
+        except FileNotFoundError:
+            pass
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+
+class CacheManager:
+    """
+    Tracks caches in subdirectories of `root` and evicts them to satisfy a quota.
+
+    Args:
+        root: directory containing caches.
+        quota_bytes: maximum total size of caches. If None, `prune` does nothing.
+    """
+
+    def __init__(self, root: str, quota_bytes: Optional[int] = None):
+        self._root = root
+        self._quota_bytes = quota_bytes
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def quota_bytes(self) -> Optional[int]:
+        return self._quota_bytes
+
+    def path(self, name: str) -> str:
+        return os.path.join(self._root, name)
+
+    def _lock_path(self, name: str) -> str:
+        return os.path.join(self._root, f".{name}.lock")
+
+    @contextlib.contextmanager
+    def _metadata(self):
+        """Context manager yielding metadata dict, saved on exit."""
+        with open(os.path.join(self._root, LOCK_FILENAME), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                path = os.path.join(self._root, METADATA_FILENAME)
+                if os.path.exists(path):
+                    with open(path, "r") as fp:
+                        metadata = json.load(fp)
+                else:
+                    metadata = {}
+                yield metadata
+                write_json(path, metadata, indent=2)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def acquire(self, name: str, config: str = "", pinned: bool = False) -> str:
+        """
+        Register use of cache `name` by this process.
+
+        Updates last access time and holds a shared lock preventing removal by other
+        processes until `release` is called or the process exits.
+
+        Args:
+            name: name of cache, i.e. subdirectory of `root`.
+            config: description of the config that produced the cache.
+            pinned: if True, the cache is pinned. Existing pins are not removed.
+
+        Returns:
+            path to cache directory.
+        """
+        path = self.path(name)
+        if path not in _held_locks:
+            _held_locks[path] = _open_locked(self._lock_path(name), fcntl.LOCK_SH)
+        with self._metadata() as metadata:
+            entry = metadata.setdefault(
+                name, dict(size=0, pinned=False, config=config, created=time.time())
+            )
+            entry["last_access"] = time.time()
+            if config:
+                entry["config"] = config
+            entry["pinned"] = entry["pinned"] or pinned
+        return path
+
+    def release(self, name: str):
+        """Release the shared lock acquired in `acquire`."""
+        lock = _held_locks.pop(self.path(name), None)
+        if lock is not None:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def update_size(self, name: str) -> int:
+        """Update the recorded size of cache `name` and return it."""
+        size = dir_size(self.path(name))
+        with self._metadata() as metadata:
+            if name in metadata:
+                metadata[name]["size"] = size
+        return size
+
+    def pin(self, name: str, pinned: bool = True):
+        """Set whether cache `name` is pinned, i.e. exempt from eviction."""
+        with self._metadata() as metadata:
+            if name not in metadata:
+                raise KeyError(f"No cache named {name} in {self._root}")
+            metadata[name]["pinned"] = pinned
+
+    def entries(self) -> Dict[str, dict]:
+        """
+        Get metadata of all caches, with sizes updated.
+
+        Untracked subdirectories of `root` are included with last access time based
+        on their modification time.
+        """
+        with self._metadata() as metadata:
+            for name in os.listdir(self._root):
+                path = self.path(name)
+                if not os.path.isdir(path):
+                    continue
+                entry = metadata.setdefault(
+                    name,
+                    dict(
+                        pinned=False,
+                        config="",
+                        created=os.path.getmtime(path),
+                        last_access=os.path.getmtime(path),
+                    ),
+                )
+                entry["size"] = dir_size(path)
+            for name in tuple(metadata):
+                if not os.path.isdir(self.path(name)):
+                    del metadata[name]
+            return {k: dict(v) for k, v in metadata.items()}
+
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self.entries().values())
+
+    def remove(self, name: str) -> bool:
+        """
+        Remove cache `name` if it is not in use.
+
+        Returns:
+            True if the cache was removed, False if it is in use by any process.
+        """
+        path = self.path(name)
+        if path in _held_locks:
+            return False
+        try:
+            lock = _open_locked(self._lock_path(name), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        with lock:
+            try:
+                with self._metadata() as metadata:
+                    shutil.rmtree(path, ignore_errors=True)
+                    metadata.pop(name, None)
+                # processes blocked on this lock retry with a new file in
+                # `_open_locked`
+                os.remove(self._lock_path(name))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        logging.info(f"Removed cache {path}")
+        return True
+
+    def prune(
+        self, quota_bytes: Optional[int] = None, required_bytes: int = 0
+    ) -> List[str]:
+        """
+        Remove least recently used unpinned caches until within quota.
+
+        Caches in use are never removed, so the quota may still be exceeded.
+
+        Args:
+            quota_bytes: quota to satisfy. Defaults to the manager's quota.
+            required_bytes: additional space to free.
+
+        Returns:
+            names of removed caches.
+        """
+        if quota_bytes is None:
+            quota_bytes = self._quota_bytes
+        if quota_bytes is None:
+            return []
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries.values())
+        removed = []
+        for name, entry in sorted(
+            entries.items(), key=lambda item: item[1]["last_access"]
+        ):
+            if total + required_bytes <= quota_bytes:
+                break
+            if entry["pinned"]:
+                continue
+            if self.remove(name):
+                removed.append(name)
+                total -= entry["size"]
+        if total + required_bytes > quota_bytes:
+            logging.warning(
+                f"Caches in {self._root} use {total} bytes, exceeding quota of "
+                f"{quota_bytes} bytes (with {required_bytes} bytes required)"
+            )
+        return removed
+
+
+def _main(argv):
+    FLAGS = flags.FLAGS
+    manager = CacheManager(os.path.expanduser(os.path.expandvars(FLAGS.root)))
+    command, *names = argv[1:]
+    if command == "list":
+        entries = manager.entries()
+        print(f"{'name':40s} {'size (MB)':>12s} {'last access':>20s} pinned")
+        for name, entry in sorted(entries.items(), key=lambda x: x[1]["last_access"]):
+            last_access = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(entry["last_access"])
+            )
+            print(
+                f"{name:40s} {entry['size'] / 1e6:12.1f} {last_access:>20s} "
+                f"{entry['pinned']}"
+            )
+        print(f"Total: {sum(e['size'] for e in entries.values()) / 1e6:.1f} MB")
+    elif command == "prune":
+        if FLAGS.quota_gb is None:
+            raise app.UsageError("--quota_gb required for prune")
+        removed = manager.prune(int(FLAGS.quota_gb * 1e9))
+        print(f"Removed {len(removed)} caches: {removed}")
+    elif command in ("pin", "unpin"):
+        for name in names:
+            manager.pin(name, command == "pin")
+    elif command == "remove":
+        for name in names:
+            if not manager.remove(name):
+                print(f"{name} is in use")
+    else:
+        raise app.UsageError(f"Unrecognized command {command}")
+
+
+if __name__ == "__main__":
+    flags.DEFINE_string("root", None, "cache root directory", required=True)
+    flags.DEFINE_float("quota_gb", None, "quota used in prune")
+    app.run(_main)
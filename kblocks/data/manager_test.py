@@ -0,0 +1,90 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+
+import tensorflow as tf
+
+from kblocks.data.cache import managed_cache, tfrecords_cache
+from kblocks.data.manager import CacheManager
+
+
+def write_cache(manager: CacheManager, name: str, size: int):
+    path = manager.acquire(name)
+    with open(os.path.join(path, "data"), "wb") as fp:
+        fp.write(b"0" * size)
+    manager.update_size(name)
+    manager.release(name)
+
+
+class CacheManagerTest(tf.test.TestCase):
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as root:
+            manager = CacheManager(root, quota_bytes=250)
+            for name in ("a", "b", "c"):
+                os.makedirs(manager.path(name))
+                write_cache(manager, name, 100)
+            manager.pin("a")
+            self.assertEqual(manager.total_bytes(), 300)
+            self.assertEqual(manager.prune(), ["b"])
+            self.assertEqual(sorted(manager.entries()), ["a", "c"])
+            # caches in use aren't evicted
+            manager.acquire("c")
+            self.assertEqual(manager.prune(quota_bytes=0), [])
+            manager.release("c")
+            self.assertEqual(manager.prune(quota_bytes=0), ["c"])
+            self.assertEqual(list(manager.entries()), ["a"])
+
+    def test_acquire_after_lock_file_removed(self):
+        with tempfile.TemporaryDirectory() as root:
+            manager = CacheManager(root)
+            os.makedirs(manager.path("a"))
+            lock_path = os.path.join(root, ".a.lock")
+            # simulate `remove` in another process holding the lock
+            with open(lock_path, "w") as remover:
+                fcntl.flock(remover, fcntl.LOCK_EX)
+                thread = threading.Thread(target=manager.acquire, args=("a",))
+                thread.start()
+                time.sleep(0.1)  # let acquire block on the old lock file
+                os.remove(lock_path)
+                fcntl.flock(remover, fcntl.LOCK_UN)
+            thread.join()
+            # the shared lock must be held on the current lock file
+            with open(lock_path, "a") as pruner:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(pruner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            manager.release("a")
+            with open(lock_path, "a") as pruner:
+                fcntl.flock(pruner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_managed_cache(self):
+        dataset = tf.data.Dataset.range(10)
+        with tempfile.TemporaryDirectory() as root:
+            cached = dataset.apply(
+                managed_cache(root, name="range", cache_factory=tfrecords_cache)
+            )
+            self.assertEqual(list(cached.as_numpy_iterator()), list(range(10)))
+            entries = CacheManager(root).entries()
+            self.assertEqual(list(entries), ["range"])
+            self.assertGreater(entries["range"]["size"], 0)
+            CacheManager(root).release("range")
+
+    def test_managed_cache_default_factory(self):
+        dataset = tf.data.Dataset.range(10)
+        with tempfile.TemporaryDirectory() as root:
+            cached = dataset.apply(managed_cache(root, name="range"))
+            entries = CacheManager(root).entries()
+            self.assertEqual(list(entries), ["range"])
+            self.assertGreater(entries["range"]["size"], 0)
+            # lazy cache files are written inside the managed directory
+            self.assertNotEmpty(os.listdir(os.path.join(root, "range")))
+            self.assertEqual(
+                [f for f in os.listdir(root) if f.startswith("range")], ["range"]
+            )
+            self.assertEqual(list(cached.as_numpy_iterator()), list(range(10)))
+            CacheManager(root).release("range")
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,56 @@
+"""
+Memoized dataset metadata.
+
+`tf.data.Dataset.cardinality` is evaluated eagerly in a number of places (e.g.
+`RepeatedData`, `dataset_and_steps`, `kblocks.models.fit`). Values here are computed
+at most once per dataset object and stored alongside it. Users can also declare
+known lengths of datasets whose cardinality would otherwise be unknown.
+"""
+import weakref
+
+import gin
+import tensorflow as tf
+
+from kblocks.data.core import Transform
+
+_cardinalities: "weakref.WeakKeyDictionary[tf.data.Dataset, int]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def cardinality(dataset: tf.data.Dataset) -> int:
+    """Get `dataset.cardinality()` as an int, computing it at most once."""
+    value = _cardinalities.get(dataset)
+    if value is None:
+        value = int(tf.keras.backend.get_value(dataset.cardinality()))
+        _cardinalities[dataset] = value
+    return value
+
+
+def register_cardinality(dataset: tf.data.Dataset, value: int) -> tf.data.Dataset:
+    """
+    Record `value` as the cardinality of `dataset` without checking it.
+
+    Returns:
+        `dataset`, for convenience.
+    """
+    _cardinalities[dataset] = int(value)
+    return dataset
+
+
+@gin.configurable(module="kb.data")
+def declared_cardinality(value: int) -> Transform:
+    """
+    Get a transform declaring the number of elements in a dataset.
+
+    The returned dataset has static cardinality `value` (checked during iteration
+    with `tf.data.experimental.assert_cardinality`) which is recorded without
+    further computation.
+    """
+
+    def transform(dataset):
+        return register_cardinality(
+            dataset.apply(tf.data.experimental.assert_cardinality(value)), value
+        )
+
+    return transform
@@ -0,0 +1,29 @@
+import tensorflow as tf
+
+from kblocks.data import metadata
+from kblocks.data.repeated import RepeatedData, dataset_and_steps
+
+
+class MetadataTest(tf.test.TestCase):
+    def test_memoized(self):
+        dataset = tf.data.Dataset.range(10)
+        self.assertEqual(metadata.cardinality(dataset), 10)
+        # registered values are not recomputed
+        metadata.register_cardinality(dataset, 5)
+        self.assertEqual(metadata.cardinality(dataset), 5)
+
+    def test_declared_cardinality(self):
+        dataset = tf.data.Dataset.range(10).filter(lambda x: x % 2 == 0)
+        self.assertEqual(metadata.cardinality(dataset), tf.data.UNKNOWN_CARDINALITY)
+        declared = dataset.apply(metadata.declared_cardinality(5))
+        self.assertEqual(metadata.cardinality(declared), 5)
+        self.assertEqual(dataset_and_steps(declared), (declared, None))
+        data = RepeatedData(declared)
+        self.assertEqual(data.steps_per_epoch, 5)
+        self.assertEqual(
+            metadata.cardinality(data.dataset), tf.data.INFINITE_CARDINALITY
+        )
+
+
+if __name__ == "__main__":
+    tf.test.main()
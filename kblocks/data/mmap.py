@@ -0,0 +1,138 @@
+"""
+Memory-mapped caches of fixed-stride records.
+
+Intended for small datasets stored in shared memory (e.g. `/dev/shm`), so multiple
+processes on the same host can read the same copy.
+"""
+import fcntl
+import os
+from typing import Optional
+
+import numpy as np
+import tensorflow as tf
+from absl import logging
+
+
+def record_dtype(spec) -> np.dtype:
+    """
+    Get the structured numpy dtype of records for elements of the given spec.
+
+    Raises:
+        ValueError if `spec` has any non-`tf.TensorSpec` components or components with
+            string dtype or partially-known shape.
+    """
+    flat_spec = tf.nest.flatten(spec, expand_composites=True)
+    for s in tf.nest.flatten(spec):
+        if not isinstance(s, tf.TensorSpec):
+            raise ValueError(f"Only dense TensorSpecs supported, got {s}")
+    for s in flat_spec:
+        if s.dtype == tf.string:
+            raise ValueError(f"string components not supported, got {s}")
+        if not s.shape.is_fully_defined():
+            raise ValueError(f"Only fully defined shapes supported, got {s}")
+    return np.dtype(
+        [
+            (f"f{i}", s.dtype.as_numpy_dtype, tuple(s.shape))
+            for i, s in enumerate(flat_spec)
+        ]
+    )
+
+
+def save(dataset: tf.data.Dataset, path: str, batch_size: int = 256) -> int:
+    """
+    Save `dataset` as fixed-stride records.
+
+    Records are written to a temporary file which is renamed on completion.
+
+    Args:
+        dataset: finite dataset with elements of fully-defined shape.
+        path: path of file to write.
+        batch_size: number of elements to convert to records at a time.
+
+    Returns:
+        number of elements written.
+    """
+    dtype = record_dtype(dataset.element_spec)
+    tmp_path = f"{path}.tmp"
+    num_elements = 0
+    with open(tmp_path, "wb") as fp:
+        for batch in dataset.batch(batch_size).as_numpy_iterator():
+            flat_batch = tf.nest.flatten(batch)
+            records = np.empty((flat_batch[0].shape[0],), dtype=dtype)
+            for name, value in zip(dtype.names, flat_batch):
+                records[name] = value
+            fp.write(records.tobytes())
+            num_elements += records.shape[0]
+    os.rename(tmp_path, path)
+    return num_elements
+
+
+def load(path: str, element_spec) -> np.memmap:
+    """Get a read-only memory map of records saved at `path`."""
+    dtype = record_dtype(element_spec)
+    if os.path.getsize(path) == 0:
+        return np.empty((0,), dtype=dtype)  # empty files can't be mapped
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def mmap_cache(
+    dataset: tf.data.Dataset,
+    path: str,
+    shuffle: bool = False,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Cache `dataset` in a memory-mapped file of fixed-stride records.
+
+    If `path` does not exist it is created. Creation is guarded by a file lock, so
+    concurrent processes caching to the same path will wait for the first to finish
+    writing rather than creating their own. Each process maps the same file, so with
+    `path` in shared memory (e.g. `/dev/shm`) there is a single copy of the data per
+    host.
+
+    Only datasets with dense elements of fully-defined shape are supported.
+
+    Args:
+        dataset: finite dataset to cache.
+        path: file to store records in.
+        shuffle: if True, records are read in a random order, reshuffled each
+            iteration.
+        seed: used in shuffling.
+
+    Returns:
+        dataset with the same elements as `dataset` (possibly shuffled), read from the
+        memory-mapped file.
+    """
+    spec = dataset.element_spec
+    dtype = record_dtype(spec)
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                logging.info(f"Saving memory-mapped records to {path}")
+                save(dataset, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    records = load(path, spec)
+    num_elements = records.shape[0]
+    flat_spec = tf.nest.flatten(spec)
+
+    def get_record(index):
+        record = records[index]
+        return tuple(np.asarray(record[name]) for name in dtype.names)
+
+    def map_func(index):
+        flat_values = tf.numpy_function(
+            get_record, (index,), tuple(s.dtype for s in flat_spec)
+        )
+        for value, s in zip(flat_values, flat_spec):
+            value.set_shape(s.shape)
+        return tf.nest.pack_sequence_as(spec, flat_values)
+
+    indices = tf.data.Dataset.range(num_elements)
+    if shuffle:
+        indices = indices.shuffle(num_elements, seed=seed)
+    return indices.map(map_func)
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from kblocks.data import mmap
+
+
+def get_dataset():
+    return tf.data.Dataset.range(10).map(
+        lambda x: {
+            "image": tf.fill((4, 5, 3), tf.cast(x, tf.uint8)),
+            "label": (x, tf.cast(x, tf.float32) / 2),
+        }
+    )
+
+
+class MmapTest(tf.test.TestCase):
+    def test_mmap_cache(self):
+        dataset = get_dataset()
+        expected = list(dataset.as_numpy_iterator())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "records")
+            cached = mmap.mmap_cache(dataset, path)
+            self.assertEqual(cached.element_spec, dataset.element_spec)
+            np.testing.assert_equal(list(cached.as_numpy_iterator()), expected)
+            # reuses existing records
+            cached = mmap.mmap_cache(dataset.skip(10), path)
+            np.testing.assert_equal(list(cached.as_numpy_iterator()), expected)
+
+    def test_shuffle(self):
+        dataset = get_dataset()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = mmap.mmap_cache(
+                dataset, os.path.join(tmp_dir, "records"), shuffle=True, seed=0
+            )
+            labels = [el["label"][0] for el in cached.as_numpy_iterator()]
+            self.assertNotEqual(labels, list(range(10)))
+            self.assertEqual(sorted(labels), list(range(10)))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            mmap.record_dtype(tf.TensorSpec((None,), tf.float32))
+        with self.assertRaises(ValueError):
+            mmap.record_dtype(tf.RaggedTensorSpec((2, None), tf.float32))
+        with self.assertRaises(ValueError):
+            mmap.record_dtype(tf.TensorSpec((), tf.string))
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,175 @@
+"""
+Optimizations of transform pipelines.
+
+`fuse_vectorized_maps` applies `map_transform`s marked `vectorizable` after subsequent
+`batch` transforms, replacing one function invocation per element with one per batch.
+"""
+from typing import Callable, Iterable, List, Mapping, Optional
+
+import gin
+import tensorflow as tf
+from absl import logging
+
+from kblocks.data.core import Transform
+from kblocks.data.tuner import run_trial
+from kblocks.spec import map_spec
+
+
+def _is_vectorizable_map(transform: Transform) -> bool:
+    return getattr(transform, "vectorizable", False)
+
+
+def _is_batch(transform: Transform) -> bool:
+    return hasattr(transform, "batch_size")
+
+
+def _is_map(transform: Transform) -> bool:
+    return hasattr(transform, "map_func")
+
+
+def _batch_spec(spec, batch_size: int, drop_remainder: bool):
+    def batch_tensor_spec(s):
+        if not isinstance(s, tf.TensorSpec):
+            raise TypeError(f"Only dense specs are supported, got {s}")
+        return tf.TensorSpec(
+            (batch_size if drop_remainder else None, *s.shape), dtype=s.dtype
+        )
+
+    return tf.nest.map_structure(batch_tensor_spec, spec)
+
+
+def _output_spec(transform: Transform, spec):
+    """
+    Get the element spec after applying `transform` without applying it.
+
+    Returns:
+        output spec, or None if it cannot be inferred (e.g. `transform` is not a
+        `kb.data.map_transform` or `kb.data.batch`, or `spec` is not dense).
+    """
+    try:
+        if _is_map(transform):
+            return map_spec(transform.map_func, spec)
+        if _is_batch(transform):
+            return _batch_spec(spec, transform.batch_size, transform.drop_remainder)
+    except (ValueError, TypeError, AttributeError) as e:
+        logging.info(f"Unable to infer spec of transform output: {e}")
+    return None
+
+
+def can_reorder(maps: Iterable[Transform], batch: Transform, spec) -> bool:
+    """
+    Check if vectorizable `maps` can be applied after `batch` to elements of `spec`.
+
+    Returns True if the element spec of applying `maps` then `batch` is the same as
+    that of applying `batch` then `maps`. Only dense specs are supported; False is
+    returned for others.
+    """
+    original = spec
+    for t in (*maps, batch):
+        original = _output_spec(t, original)
+        if original is None:
+            return False
+    fused = spec
+    for t in (batch, *maps):
+        fused = _output_spec(t, fused)
+        if fused is None:
+            return False
+    return original == fused
+
+
+def optimize_transforms(
+    transforms: Iterable[Optional[Transform]], spec
+) -> List[Transform]:
+    """
+    Get transforms with vectorizable maps moved after subsequent batches.
+
+    Maps are only moved if `can_reorder`. Maps are only moved past batch transforms
+    created by `kb.data.batch`, and are never moved past other transforms.
+
+    Specs are inferred from `kb.data.map_transform` functions and `kb.data.batch`
+    arguments without applying any transforms. No maps are moved after the first
+    transform whose output spec cannot be inferred.
+
+    Args:
+        transforms: transforms, e.g. as used in `kb.data.compound_transform`.
+        spec: element spec of inputs to the first transform.
+
+    Returns:
+        list of reordered transforms.
+    """
+    transforms = [t for t in transforms if t is not None]
+    out = []
+    pending = []
+    for i, transform in enumerate(transforms):
+        if spec is None:
+            # unknown spec, so nothing more can be reordered
+            out.extend(pending)
+            out.extend(transforms[i:])
+            return out
+        if _is_vectorizable_map(transform):
+            pending.append(transform)
+            continue
+        if pending and _is_batch(transform) and can_reorder(pending, transform, spec):
+            logging.info(f"Applying {len(pending)} vectorizable maps after batching")
+            group = [transform, *pending]
+        else:
+            group = [*pending, transform]
+        out.extend(group)
+        pending = []
+        if i < len(transforms) - 1:
+            for t in group:
+                spec = _output_spec(t, spec)
+                if spec is None:
+                    break
+    out.extend(pending)
+    return out
+
+
+@gin.configurable(module="kb.data")
+def fuse_vectorized_maps(transforms: Iterable[Optional[Transform]]) -> Transform:
+    """
+    Equivalent of `kb.data.compound_transform` with vectorizable maps fused.
+
+    See `optimize_transforms`.
+    """
+    transforms = tuple(transforms)
+
+    def transform(dataset):
+        for t in optimize_transforms(transforms, dataset.element_spec):
+            dataset = t(dataset)
+        return dataset
+
+    return transform
+
+
+def benchmark_fusion(
+    dataset: tf.data.Dataset,
+    transforms: Iterable[Optional[Transform]],
+    num_elements: int = 100,
+    num_warmup: int = 10,
+    print_fn: Callable[[str], None] = logging.info,
+) -> Mapping[str, float]:
+    """
+    Measure the throughput of `transforms` with and without fused maps.
+
+    Returns:
+        dict with "original" and "fused" elements per second and "speedup".
+    """
+    transforms = tuple(transforms)
+    original = dataset
+    for t in transforms:
+        if t is not None:
+            original = t(original)
+    fused = dataset.apply(fuse_vectorized_maps(transforms))
+    results = {
+        name: run_trial(ds, num_elements=num_elements, num_warmup=num_warmup)[
+            "elements_per_sec"
+        ]
+        for name, ds in (("original", original), ("fused", fused))
+    }
+    results["speedup"] = results["fused"] / results["original"]
+    print_fn(
+        f"Vectorized map fusion: {results['original']:.1f} -> "
+        f"{results['fused']:.1f} elements/sec ({results['speedup']:.2f}x)"
+    )
+    return results
@@ -0,0 +1,76 @@
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from kblocks.data import core
+from kblocks.data.cache import save_load_cache
+from kblocks.data.optimize import (
+    benchmark_fusion,
+    fuse_vectorized_maps,
+    optimize_transforms,
+)
+
+
+def as_list(dataset):
+    return [x.tolist() for x in dataset.as_numpy_iterator()]
+
+
+class OptimizeTest(tf.test.TestCase):
+    def test_fuse_vectorized_maps(self):
+        dataset = tf.data.Dataset.range(10)
+        double = core.map_transform(lambda x: x * 2, vectorizable=True)
+        batch = core.batch(3)
+        transforms = [double, core.map_transform(lambda x: x + 1), double, batch]
+        optimized = optimize_transforms(transforms, dataset.element_spec)
+        self.assertEqual(optimized, [double, transforms[1], batch, double])
+        expected = as_list(core.compound_transform(transforms)(dataset))
+        actual = dataset
+        for t in optimized:
+            actual = t(actual)
+        self.assertEqual(as_list(actual), expected)
+
+    def test_spec_mismatch(self):
+        dataset = tf.data.Dataset.range(10)
+        # not actually vectorizable - changes output shape
+        reduce = core.map_transform(
+            lambda x: tf.reduce_sum(tf.reshape(x, (-1,))), vectorizable=True
+        )
+        transforms = [reduce, core.batch(2)]
+        self.assertEqual(
+            optimize_transforms(transforms, dataset.element_spec), transforms
+        )
+
+    def test_transforms_not_applied(self):
+        dataset = tf.data.Dataset.range(10)
+        double = core.map_transform(lambda x: x * 2, vectorizable=True)
+        batch = core.batch(4)
+
+        def eager_transform(dataset):
+            raise AssertionError("transforms should not be applied")
+
+        transforms = [double, batch, eager_transform, double, core.batch(2)]
+        optimized = optimize_transforms(transforms, dataset.element_spec)
+        # maps after transforms with unknown specs are not moved
+        self.assertEqual(optimized, [batch, double, eager_transform, *transforms[3:]])
+
+    def test_save_load_cache(self):
+        dataset = tf.data.Dataset.range(10)
+        double = core.map_transform(lambda x: x * 2, vectorizable=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            transforms = [double, core.batch(4), save_load_cache(tmp_dir)]
+            actual = dataset.apply(fuse_vectorized_maps(transforms))
+            self.assertEqual(as_list(actual), [[0, 2, 4, 6], [8, 10, 12, 14], [16, 18]])
+
+    def test_benchmark_fusion(self):
+        dataset = tf.data.Dataset.range(1000)
+        result = benchmark_fusion(
+            dataset,
+            [core.map_transform(lambda x: x * 2, vectorizable=True), core.batch(4)],
+            num_elements=10,
+        )
+        self.assertTrue(np.isfinite(result["speedup"]))
+
+
+if __name__ == "__main__":
+    tf.test.main()
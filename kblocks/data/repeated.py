@@ -1,8 +1,10 @@
-from typing import Optional, Tuple, Union
+from typing import Callable, Optional, Sequence, Tuple, Union
 
 import gin
 import tensorflow as tf
 
+from kblocks.data import metadata
+
 
 @gin.configurable(module="kb.data")
 class RepeatedData:
@@ -27,10 +29,31 @@ class RepeatedData:
     ```
 
     This will give data augmentation that is different each epoch.
+
+    Multi-worker training is supported by sharding elements between workers. Each
+    worker takes every `num_workers`th element starting from `worker_index`, and all
+    workers use the same `steps_per_epoch`, `global_steps_per_epoch // num_workers`.
+    Up to `num_workers - 1` trailing elements of each epoch may therefore be
+    dropped. If the base pipeline is deterministic, so is each worker's stream. See
+    `sharded_repeated_data` for file-level sharding.
+
+    Args:
+        dataset: base dataset. If finite, it is repeated after sharding.
+        steps_per_epoch: global number of steps per epoch (i.e. before sharding).
+            Inferred from `dataset.cardinality()` if not given.
+        num_workers: number of workers to shard between.
+        worker_index: index of this worker in `[0, num_workers)`.
     """
 
-    def __init__(self, dataset: tf.data.Dataset, steps_per_epoch: Optional[int] = None):
-        cardinality = tf.keras.backend.get_value(dataset.cardinality())
+    def __init__(
+        self,
+        dataset: tf.data.Dataset,
+        steps_per_epoch: Optional[int] = None,
+        num_workers: int = 1,
+        worker_index: int = 0,
+    ):
+        _check_worker(num_workers, worker_index)
+        cardinality = metadata.cardinality(dataset)
         if steps_per_epoch is None:
             steps_per_epoch = cardinality
             if cardinality == tf.data.INFINITE_CARDINALITY:
@@ -38,11 +61,25 @@ class RepeatedData:
                     "steps_per_epoch must be provided if dataset has infinite "
                     "cardinality"
                 )
-            dataset = dataset.repeat()
         elif cardinality != tf.data.INFINITE_CARDINALITY:
             assert cardinality == steps_per_epoch
+        finite = cardinality != tf.data.INFINITE_CARDINALITY
+        if num_workers > 1:
+            if steps_per_epoch < num_workers:
+                raise ValueError(
+                    f"steps_per_epoch must be at least num_workers, but "
+                    f"{steps_per_epoch} < {num_workers}"
+                )
+            dataset = dataset.shard(num_workers, worker_index)
+            steps_per_epoch //= num_workers
+            if finite:
+                # all workers must take the same number of steps each epoch
+                dataset = dataset.take(steps_per_epoch)
+        if finite:
             dataset = dataset.repeat()
-        self._dataset = dataset
+        self._dataset = metadata.register_cardinality(
+            dataset, tf.data.INFINITE_CARDINALITY
+        )
         self._steps_per_epoch = steps_per_epoch
 
     @property
@@ -54,6 +91,70 @@ class RepeatedData:
         return self._dataset
 
 
+def _check_worker(num_workers: int, worker_index: int):
+    if num_workers < 1:
+        raise ValueError(f"num_workers must be positive, got {num_workers}")
+    if not 0 <= worker_index < num_workers:
+        raise ValueError(
+            f"worker_index must be in [0, {num_workers}), got {worker_index}"
+        )
+
+
+@gin.configurable(module="kb.data")
+def sharded_repeated_data(
+    paths: Sequence[str],
+    dataset_fn: Callable[[Sequence[str]], tf.data.Dataset],
+    num_workers: int = 1,
+    worker_index: int = 0,
+    steps_per_epoch: Optional[int] = None,
+) -> RepeatedData:
+    """
+    Get `RepeatedData` for this worker with file-level sharding.
+
+    Worker `i` reads `paths[i::num_workers]`. Unlike element-level sharding, workers
+    do not read (and discard) each other's data, but shards may differ in size. All
+    workers take `min_shard_steps` steps per epoch, where `min_shard_steps` is the
+    minimum cardinality over all workers' datasets, so `dataset_fn` should give
+    datasets with known cardinality (e.g. via `kb.data.assert_cardinality` with
+    per-file counts) and be cheap to call.
+
+    Args:
+        paths: sorted file paths.
+        dataset_fn: function mapping a subset of `paths` to a finite dataset.
+        num_workers: number of workers.
+        worker_index: index of this worker in `[0, num_workers)`.
+        steps_per_epoch: global steps per epoch. If given, each worker takes
+            `steps_per_epoch // num_workers` steps per epoch and `dataset_fn` is only
+            called for this worker's paths.
+
+    Returns:
+        `RepeatedData` of this worker's shard.
+    """
+    _check_worker(num_workers, worker_index)
+    paths = list(paths)
+    if len(paths) < num_workers:
+        raise ValueError(
+            f"Cannot shard {len(paths)} files between {num_workers} workers"
+        )
+    dataset = dataset_fn(paths[worker_index::num_workers])
+    if steps_per_epoch is None:
+        cardinalities = [
+            metadata.cardinality(dataset_fn(paths[i::num_workers]))
+            for i in range(num_workers)
+        ]
+        if any(c < 0 for c in cardinalities):
+            raise ValueError(
+                "steps_per_epoch must be provided if any shard has unknown or "
+                f"infinite cardinality, got cardinalities {cardinalities}"
+            )
+        worker_steps = min(cardinalities)
+    else:
+        worker_steps = steps_per_epoch // num_workers
+    if metadata.cardinality(dataset) != worker_steps:
+        dataset = dataset.take(worker_steps)
+    return RepeatedData(dataset.repeat(), worker_steps)
+
+
 @gin.register(module="kb.data")
 def repeated_data(data: Union[tf.data.Dataset, RepeatedData]) -> RepeatedData:
     if isinstance(data, tf.data.Dataset):
@@ -71,7 +172,7 @@ def dataset_and_steps(
         assert steps is None or steps == data.steps_per_epoch
         return data.dataset, data.steps_per_epoch
     assert isinstance(data, tf.data.Dataset)
-    cardinality = tf.keras.backend.get_value(data.cardinality())
+    cardinality = metadata.cardinality(data)
     if steps is None:
         assert cardinality > 0
         return data, None
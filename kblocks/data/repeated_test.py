@@ -0,0 +1,72 @@
+import os
+
+import tensorflow as tf
+
+from kblocks.data.repeated import RepeatedData, sharded_repeated_data
+
+
+def take_epochs(data: RepeatedData, num_epochs: int):
+    return [
+        x.tolist()
+        for x in data.dataset.take(
+            num_epochs * data.steps_per_epoch
+        ).as_numpy_iterator()
+    ]
+
+
+class RepeatedDataTest(tf.test.TestCase):
+    def test_element_sharding(self):
+        dataset = tf.data.Dataset.range(10)
+        shards = [
+            RepeatedData(dataset, num_workers=3, worker_index=i) for i in range(3)
+        ]
+        for shard in shards:
+            self.assertEqual(shard.steps_per_epoch, 3)
+        self.assertEqual(take_epochs(shards[0], 2), [0, 3, 6, 0, 3, 6])
+        self.assertEqual(take_epochs(shards[1], 1), [1, 4, 7])
+        self.assertEqual(take_epochs(shards[2], 1), [2, 5, 8])
+
+    def test_infinite_sharding(self):
+        dataset = tf.data.Dataset.range(10).repeat()
+        data = RepeatedData(dataset, 10, num_workers=2, worker_index=1)
+        self.assertEqual(data.steps_per_epoch, 5)
+        self.assertEqual(take_epochs(data, 2), [1, 3, 5, 7, 9] * 2)
+
+    def test_invalid_worker(self):
+        dataset = tf.data.Dataset.range(10)
+        with self.assertRaises(ValueError):
+            RepeatedData(dataset, num_workers=2, worker_index=2)
+        with self.assertRaises(ValueError):
+            RepeatedData(dataset, num_workers=11, worker_index=0)
+
+    def test_file_sharding(self):
+        sizes = [3, 5, 2, 4]
+        paths = [os.path.join(self.get_temp_dir(), f"{i}.txt") for i in range(4)]
+        for i, (path, size) in enumerate(zip(paths, sizes)):
+            with open(path, "w") as fp:
+                fp.write("\n".join(str(10 * i + j) for j in range(size)))
+
+        def dataset_fn(paths):
+            return (
+                tf.data.TextLineDataset(paths)
+                .map(tf.strings.to_number)
+                .apply(
+                    tf.data.experimental.assert_cardinality(
+                        sum(sizes[int(os.path.basename(p)[0])] for p in paths)
+                    )
+                )
+            )
+
+        shards = [sharded_repeated_data(paths, dataset_fn, 2, i) for i in range(2)]
+        for shard in shards:
+            self.assertEqual(shard.steps_per_epoch, 5)
+        self.assertEqual(take_epochs(shards[0], 1), [0, 1, 2, 20, 21])
+        self.assertEqual(take_epochs(shards[1], 1), [10, 11, 12, 13, 14])
+
+        data = sharded_repeated_data(paths, dataset_fn, 2, 1, steps_per_epoch=8)
+        self.assertEqual(data.steps_per_epoch, 4)
+        self.assertEqual(take_epochs(data, 2), [10, 11, 12, 13] * 2)
+
+
+if __name__ == "__main__":
+    tf.test.main()
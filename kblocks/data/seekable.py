@@ -0,0 +1,153 @@
+"""
+Deterministic data pipelines with lightweight, seekable positions.
+
+Checkpointing a `tf.data.Iterator` saves the contents of shuffle and prefetch buffers,
+which can be large and slow to save. `SeekableData` instead saves the position in
+the stream (a step count) and seed, and rebuilds the pipeline from that position when
+iterated. The pipeline must support starting part-way through an epoch without
+iterating over earlier elements - see `seekable_indexed_data` for an implementation
+based on `kblocks.data.indexed` caches.
+"""
+import os
+from typing import Callable, Optional
+
+import gin
+import tensorflow as tf
+from absl import logging
+
+from kblocks.data import indexed
+
+
+@gin.configurable(module="kb.data")
+class SeekableData(tf.Module):
+    """
+    Infinite dataset with a checkpointable position.
+
+    The checkpointed state is a scalar `position` (total number of steps consumed)
+    and `seed`. Each time `dataset` is accessed a new dataset is built starting from
+    the current position. Users (e.g. `kblocks.models.fit`) are responsible for
+    calling `advance` after each step.
+
+    Args:
+        dataset_fn: function `(epoch, start, seed) -> dataset` giving the elements of
+            epoch `epoch` from step `start` onwards. `epoch` may be a tensor, `start`
+            is 0 unless `epoch` is the first epoch iterated. Returned datasets should
+            have `steps_per_epoch - start` elements and should not depend on anything
+            other than the arguments.
+        steps_per_epoch: number of steps in each epoch.
+        seed: seed passed to `dataset_fn`.
+    """
+
+    def __init__(
+        self,
+        dataset_fn: Callable[[tf.Tensor, int, int], tf.data.Dataset],
+        steps_per_epoch: int,
+        seed: int = 0,
+        name: Optional[str] = None,
+    ):
+        super().__init__(name=name)
+        self._dataset_fn = dataset_fn
+        self._steps_per_epoch = steps_per_epoch
+        self.position = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.seed = tf.Variable(seed, dtype=tf.int64, trainable=False)
+
+    @property
+    def steps_per_epoch(self) -> int:
+        return self._steps_per_epoch
+
+    @property
+    def epoch(self) -> int:
+        return int(self.position.numpy()) // self._steps_per_epoch
+
+    @property
+    def step(self) -> int:
+        """Step within the current epoch."""
+        return int(self.position.numpy()) % self._steps_per_epoch
+
+    @property
+    def element_spec(self):
+        return self._dataset_fn(
+            tf.constant(0, tf.int64), 0, int(self.seed.numpy())
+        ).element_spec
+
+    @property
+    def dataset(self) -> tf.data.Dataset:
+        """Infinite dataset starting at the current position."""
+        epoch = self.epoch
+        seed = int(self.seed.numpy())
+        first = self._dataset_fn(tf.constant(epoch, tf.int64), self.step, seed)
+        rest = tf.data.Dataset.range(epoch + 1, tf.int64.max).flat_map(
+            lambda e: self._dataset_fn(e, 0, seed)
+        )
+        return first.concatenate(rest)
+
+    def advance(self, steps: int = 1):
+        self.position.assign_add(steps)
+
+    def seek(self, position: int):
+        self.position.assign(position)
+
+
+@gin.configurable(module="kb.data")
+def seekable_indexed_data(
+    dataset: tf.data.Dataset,
+    cache_dir: str,
+    batch_size: int,
+    shuffle: bool = True,
+    seed: int = 0,
+    num_parallel_calls: int = 1,
+    deterministic: Optional[bool] = None,
+    record_format: str = "tensor",
+) -> SeekableData:
+    """
+    Get `SeekableData` of batches of an indexed cache of `dataset`.
+
+    Each epoch is a permutation of the cached elements based only on `seed` and the
+    epoch. Seeking slices the permutation, so costs `O(num_elements)` index
+    operations rather than reading and discarding earlier elements. Partial batches
+    are dropped.
+
+    Args:
+        dataset: finite dataset to cache.
+        cache_dir: directory to save the `kblocks.data.indexed` cache in.
+        batch_size: number of elements per step.
+        shuffle: if True, each epoch is a different permutation of elements.
+        seed: initial seed for permutations.
+        num_parallel_calls: used in reading and deserialization.
+        deterministic: used in reading and deserialization.
+        record_format: one of `tfrecords.RECORD_FORMATS`.
+
+    Returns:
+        `SeekableData` with `num_elements // batch_size` steps per epoch.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    if not indexed.is_complete(cache_dir):
+        logging.info(f"Saving indexed dataset to {cache_dir}")
+        indexed.save(dataset, cache_dir, record_format=record_format)
+    num_elements = indexed.num_records(cache_dir)
+    steps_per_epoch = num_elements // batch_size
+    if steps_per_epoch == 0:
+        raise ValueError(
+            f"batch_size {batch_size} is larger than number of elements {num_elements}"
+        )
+    spec = dataset.element_spec
+
+    def dataset_fn(epoch, start, seed):
+        indices = tf.range(num_elements, dtype=tf.int64)
+        if shuffle:
+            seeds = tf.stack([tf.constant(seed, tf.int64), tf.cast(epoch, tf.int64)])
+            indices = tf.argsort(
+                tf.random.stateless_uniform((num_elements,), seed=seeds)
+            )
+            indices = tf.cast(indices, tf.int64)
+        indices = indices[start * batch_size : steps_per_epoch * batch_size]
+        return indexed.read(
+            tf.data.Dataset.from_tensor_slices(indices),
+            cache_dir,
+            spec=spec,
+            num_parallel_calls=num_parallel_calls,
+            deterministic=deterministic,
+            record_format=record_format,
+        ).batch(batch_size, drop_remainder=True)
+
+    return SeekableData(dataset_fn, steps_per_epoch, seed=seed)
@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from kblocks.data.seekable import SeekableData, seekable_indexed_data
+
+
+def take(data: SeekableData, num_steps: int):
+    """Take `num_steps` from a new iterator, advancing as `fit` does."""
+    out = []
+    it = iter(data.dataset)
+    for _ in range(num_steps):
+        out.append(next(it).numpy())
+        data.advance()
+    return out
+
+
+class SeekableTest(tf.test.TestCase):
+    def test_seekable_indexed_data(self):
+        dataset = tf.data.Dataset.range(10)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data = seekable_indexed_data(dataset, tmp_dir, batch_size=3, seed=0)
+            self.assertEqual(data.steps_per_epoch, 3)
+            expected = take(data, 7)
+            self.assertEqual(data.epoch, 2)
+            self.assertEqual(data.step, 1)
+            for epoch in range(2):
+                values = np.concatenate(expected[3 * epoch : 3 * epoch + 3])
+                self.assertEqual(np.unique(values).size, 9)
+            self.assertFalse(np.all(expected[0] == expected[3]))
+
+            data.seek(0)
+            np.testing.assert_equal(take(data, 7), expected)
+            data.seek(4)
+            np.testing.assert_equal(take(data, 3), expected[4:])
+
+    def test_checkpoint(self):
+        dataset = tf.data.Dataset.range(10)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data = seekable_indexed_data(dataset, tmp_dir, batch_size=2, seed=1)
+            expected = take(data, 8)
+            data.seek(0)
+            take(data, 3)
+            checkpoint = tf.train.Checkpoint(data=data)
+            path = checkpoint.save(os.path.join(tmp_dir, "ckpt", "ckpt"))
+
+            restored = seekable_indexed_data(dataset, tmp_dir, batch_size=2, seed=2)
+            tf.train.Checkpoint(data=restored).restore(path).assert_consumed()
+            self.assertEqual(int(restored.seed.numpy()), 1)
+            np.testing.assert_equal(take(restored, 5), expected[3:])
+
+    def test_custom_dataset_fn(self):
+        def dataset_fn(epoch, start, seed):
+            del seed
+            return tf.data.Dataset.range(start, 4).map(lambda x: x + 10 * epoch)
+
+        data = SeekableData(dataset_fn, 4)
+        data.seek(6)
+        self.assertEqual(take(data, 4), [12, 13, 20, 21])
+
+
+if __name__ == "__main__":
+    tf.test.main()
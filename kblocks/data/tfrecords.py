@@ -3,13 +3,24 @@ Simple re-implementation of tf.data.Dataset.cache.
 
 I feel there's a memory leak -somewhere- related to the official implementation.
 """
-from typing import Optional
+import gzip
+import os
+import queue
+import socket
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
 
+import numpy as np
 import tensorflow as tf
 from absl import logging
 
 AUTOTUNE = tf.data.experimental.AUTOTUNE
 
+RECORD_FORMATS = ("tensor", "flat")
+CHUNK_CODECS = ("", "ZLIB", "GZIP")
+
 
 def serialize_example(*args, **kwargs):
     flat_example = tf.nest.flatten((args, kwargs), expand_composites=True)
@@ -34,6 +45,274 @@ def deserializer(spec):
     return deserialize_example
 
 
+def _flat_spec(spec) -> List[tf.TensorSpec]:
+    flat_spec = tf.nest.flatten(spec, expand_composites=True)
+    for s in flat_spec:
+        if s.shape.rank is None:
+            raise ValueError(f"flat records require known ranks, got {s}")
+        if s.dtype == tf.string:
+            raise ValueError(f"flat records do not support strings, got {s}")
+    return flat_spec
+
+
+def _unknown_dims(flat_spec: Sequence[tf.TensorSpec]) -> List[List[int]]:
+    return [[i for i, d in enumerate(s.shape) if d is None] for s in flat_spec]
+
+
+def flat_serializer(spec):
+    """
+    Get a function mapping elements to a single raw byte string.
+
+    Each record is an int64 header followed by the raw bytes of each flattened
+    component of `spec`. The header contains the number of bytes of each component
+    followed by the sizes of all statically unknown dimensions, so its layout is
+    fixed by `spec` and no other metadata is stored.
+    """
+    flat_spec = _flat_spec(spec)
+    unknown_dims = _unknown_dims(flat_spec)
+
+    def to_bytes(*flat_example: np.ndarray) -> bytes:
+        header = [x.nbytes for x in flat_example]
+        for x, dims in zip(flat_example, unknown_dims):
+            header.extend(x.shape[i] for i in dims)
+        flat_example = (np.array(header, np.int64),) + flat_example
+        return b"".join(np.ascontiguousarray(x).tobytes() for x in flat_example)
+
+    def serialize_example(*args, **kwargs):
+        flat_example = tf.nest.flatten((args, kwargs), expand_composites=True)
+        serialized = tf.numpy_function(to_bytes, flat_example, tf.string)
+        serialized.set_shape(())
+        return serialized
+
+    return serialize_example
+
+
+def _decode_bytes(data: tf.Tensor, dtype: tf.DType) -> tf.Tensor:
+    """Reinterpret flat uint8 `data` as a flat tensor of `dtype`."""
+    if dtype == tf.uint8:
+        return data
+    if dtype == tf.bool:
+        return tf.cast(data, tf.bool)
+    if dtype.size == 1:
+        return tf.bitcast(data, dtype)
+    return tf.bitcast(tf.reshape(data, (-1, dtype.size)), dtype)
+
+
+def flat_deserializer(spec):
+    """Get the inverse of `flat_serializer(spec)`."""
+    flat_spec = _flat_spec(spec)
+    unknown_dims = _unknown_dims(flat_spec)
+    num_components = len(flat_spec)
+    header_size = num_components + sum(len(dims) for dims in unknown_dims)
+
+    def deserialize_example(example):
+        data = tf.io.decode_raw(example, tf.uint8)
+        header = _decode_bytes(data[: 8 * header_size], tf.int64)
+        chunks = tf.split(
+            data[8 * header_size :], header[:num_components], num=num_components
+        )
+        offset = num_components
+        flat_example = []
+        for chunk, s, dims in zip(chunks, flat_spec, unknown_dims):
+            shape = [-1 if d is None else d for d in s.shape]
+            if len(dims) > 1:
+                # the single unknown dimension case is inferred by reshape
+                for i in dims:
+                    shape[i] = header[offset]
+                    offset += 1
+                shape = tf.stack(shape)
+            else:
+                offset += len(dims)
+            x = tf.reshape(_decode_bytes(chunk, s.dtype), shape)
+            x.set_shape(s.shape)
+            flat_example.append(x)
+        return tf.nest.pack_sequence_as(spec, flat_example, expand_composites=True)
+
+    return deserialize_example
+
+
+def parse_flat_blocks(
+    loaded: tf.data.Dataset,
+    spec,
+    block_size: int,
+    num_parallel_calls=1,
+    deterministic=None,
+) -> tf.data.Dataset:
+    """
+    Parse "flat" records `block_size` at a time.
+
+    The bytes of each component of a block of records are joined and decoded with a
+    single `decode_raw` before being unbatched. Only components with a non-leading unknown
+    dimension require reshaping after unbatching, so per-element overhead is small.
+
+    Args:
+        loaded: dataset of records written with `flat_serializer(spec)`.
+        spec: element spec of the original dataset.
+        block_size: number of records decoded at once.
+        num_parallel_calls: used when decoding blocks.
+        deterministic: used when decoding blocks.
+
+    Returns:
+        dataset with `spec` elements.
+    """
+    flat_spec = _flat_spec(spec)
+    unknown_dims = _unknown_dims(flat_spec)
+    num_components = len(flat_spec)
+    header_size = num_components + sum(len(dims) for dims in unknown_dims)
+    needs_finalize = any(unknown_dims) or len(tf.nest.flatten(spec)) != num_components
+
+    def decode_block(examples):
+        header = tf.io.decode_raw(
+            tf.strings.substr(examples, 0, 8 * header_size), tf.int64
+        )
+        sizes = header[:, :num_components]
+        starts = tf.cumsum(sizes, axis=1, exclusive=True) + 8 * header_size
+        offset = num_components
+        components = []
+        for i, (s, dims) in enumerate(zip(flat_spec, unknown_dims)):
+            chunks = tf.strings.substr(examples, starts[:, i], sizes[:, i])
+            values = tf.io.decode_raw(tf.strings.reduce_join(chunks), s.dtype)
+            if not dims:
+                x = tf.reshape(values, [-1, *s.shape])
+            elif dims == [0]:
+                x = tf.RaggedTensor.from_row_lengths(
+                    tf.reshape(values, [-1, *s.shape[1:]]),
+                    header[:, offset],
+                    validate=False,
+                )
+            else:
+                x = tf.RaggedTensor.from_row_lengths(
+                    values, sizes[:, i] // s.dtype.size, validate=False
+                )
+            offset += len(dims)
+            components.append(x)
+        if needs_finalize:
+            return header, tuple(components)
+        return tf.nest.pack_sequence_as(spec, components)
+
+    def finalize(header, components):
+        offset = num_components
+        flat_example = []
+        for x, s, dims in zip(components, flat_spec, unknown_dims):
+            if dims and dims != [0]:
+                shape = [d for d in s.shape]
+                for i in dims:
+                    shape[i] = header[offset]
+                    offset += 1
+                x = tf.reshape(x, tf.stack(shape))
+            else:
+                offset += len(dims)
+            x.set_shape(s.shape)
+            flat_example.append(x)
+        return tf.nest.pack_sequence_as(spec, flat_example, expand_composites=True)
+
+    dataset = (
+        loaded.batch(block_size)
+        .map(decode_block, num_parallel_calls, deterministic=deterministic)
+        .unbatch()
+    )
+    if needs_finalize:
+        dataset = dataset.map(finalize, num_parallel_calls, deterministic=deterministic)
+    return dataset
+
+
+def record_serializer(spec, record_format: str):
+    """Get a function mapping elements of `spec` to records in `record_format`."""
+    if record_format == "tensor":
+        return serialize_example
+    if record_format == "flat":
+        return flat_serializer(spec)
+    raise ValueError(
+        f"record_format must be one of {RECORD_FORMATS}, got {record_format}"
+    )
+
+
+def record_deserializer(spec, record_format: str):
+    """Get the inverse of `record_serializer(spec, record_format)`."""
+    if record_format == "tensor":
+        return deserializer(spec)
+    if record_format == "flat":
+        return flat_deserializer(spec)
+    raise ValueError(
+        f"record_format must be one of {RECORD_FORMATS}, got {record_format}"
+    )
+
+
+def _prefix(record_format: str) -> str:
+    return "serialized" if record_format == "tensor" else record_format
+
+
+def _compress_fn(codec: str, level: int):
+    if codec == "ZLIB":
+        return lambda data: zlib.compress(data, level)
+    if codec == "GZIP":
+        return lambda data: gzip.compress(data, level)
+    raise ValueError(f"codec must be one of {CHUNK_CODECS}, got {codec}")
+
+
+def compress_chunks(
+    serialized: tf.data.Dataset, codec: str, chunk_size: int, level: int = 6
+) -> tf.data.Dataset:
+    """
+    Combine serialized records into independently compressed chunks.
+
+    Compression is performed in parallel using python's `zlib` / `gzip`, which release
+    the GIL.
+
+    Args:
+        serialized: dataset of scalar string records.
+        codec: one of `CHUNK_CODECS`. "" results in uncompressed chunks.
+        chunk_size: number of records per chunk.
+        level: compression level.
+
+    Returns:
+        dataset of scalar string chunks.
+    """
+    chunks = serialized.batch(chunk_size).map(tf.io.serialize_tensor)
+    if codec == "":
+        return chunks
+    compress = _compress_fn(codec, level)
+
+    def map_func(chunk):
+        chunk = tf.numpy_function(compress, (chunk,), tf.string)
+        chunk.set_shape(())
+        return chunk
+
+    return chunks.map(map_func, num_parallel_calls=AUTOTUNE)
+
+
+def decompress_chunks(
+    loaded: tf.data.Dataset,
+    codec: str,
+    num_parallel_calls: int = 1,
+    deterministic: Optional[bool] = None,
+) -> tf.data.Dataset:
+    """
+    Reverse `compress_chunks`.
+
+    Args:
+        loaded: dataset of chunks.
+        codec: codec used in `compress_chunks`.
+        num_parallel_calls: number of chunks to decompress in parallel.
+        deterministic: used in decompression.
+
+    Returns:
+        dataset of scalar string records.
+    """
+    if codec not in CHUNK_CODECS:
+        raise ValueError(f"codec must be one of {CHUNK_CODECS}, got {codec}")
+
+    def map_func(chunk):
+        chunk = tf.io.decode_compressed(chunk, compression_type=codec)
+        records = tf.io.parse_tensor(chunk, tf.string)
+        records.set_shape((None,))
+        return records
+
+    return loaded.map(
+        map_func, num_parallel_calls=num_parallel_calls, deterministic=deterministic
+    ).unbatch()
+
+
 def save_serialized(
     serialized: tf.data.Dataset, path: str, compression: Optional[str] = None
 ):
@@ -41,23 +320,323 @@ def save_serialized(
     return writer.write(serialized)
 
 
-def save(dataset: tf.data.Dataset, path: str, compression: Optional[str] = None):
+def _serialize(
+    dataset: tf.data.Dataset,
+    record_format: str,
+    chunk_codec: Optional[str] = None,
+    chunk_size: int = 64,
+) -> tf.data.Dataset:
     serialized = dataset.map(
-        serialize_example,
+        record_serializer(dataset.element_spec, record_format),
         num_parallel_calls=tf.data.experimental.AUTOTUNE,
     )
+    if chunk_codec is not None:
+        serialized = compress_chunks(serialized, chunk_codec, chunk_size)
+    return serialized
+
+
+def save(
+    dataset: tf.data.Dataset,
+    path: str,
+    compression: Optional[str] = None,
+    record_format: str = "tensor",
+    chunk_codec: Optional[str] = None,
+    chunk_size: int = 64,
+):
+    serialized = _serialize(dataset, record_format, chunk_codec, chunk_size)
     # data corruptions with num_parallel_calls != 1?
     # https://github.com/tensorflow/tensorflow/issues/13463
     return save_serialized(serialized, path=path, compression=compression)
 
 
+def shard_paths(
+    cache_dir: str, num_shards: int, prefix: str = "serialized"
+) -> Tuple[str, ...]:
+    """Get the paths of each shard of a sharded cache in `cache_dir`."""
+    return tuple(
+        os.path.join(cache_dir, f"{prefix}-{i:05d}-of-{num_shards:05d}.tfrecords")
+        for i in range(num_shards)
+    )
+
+
+def _write_shard(
+    path: str,
+    records: queue.Queue,
+    compression: Optional[str],
+    failed: threading.Event,
+):
+    tmp_path = path + ".tmp"
+    try:
+        with tf.io.TFRecordWriter(tmp_path, options=compression) as writer:
+            for record in iter(records.get, None):
+                writer.write(record)
+    except Exception:
+        failed.set()
+        # drain remaining records so the producer never blocks on a dead shard
+        for _ in iter(records.get, None):
+            pass
+        raise
+    if failed.is_set():
+        tf.io.gfile.remove(tmp_path)
+    else:
+        tf.io.gfile.rename(tmp_path, path, overwrite=True)
+
+
+def save_serialized_sharded(
+    serialized: tf.data.Dataset,
+    paths: Sequence[str],
+    compression: Optional[str] = None,
+    queue_size: int = 64,
+):
+    """
+    Write `serialized` to `len(paths)` shards in parallel.
+
+    Element `i` is written to `paths[i % len(paths)]`, so the original order can be
+    recovered by a round-robin interleave over the shards (see `load_sharded`). Each
+    shard is written by its own thread to a temporary file which is only renamed to
+    its final path once complete, so partially written shards are never visible.
+    If any shard fails, no further shards are committed.
+
+    Must be run in eager mode.
+    """
+    if not tf.executing_eagerly():
+        raise RuntimeError("Sharded tfrecords can only be written in eager mode.")
+    failed = threading.Event()
+    queues = [queue.Queue(queue_size) for _ in paths]
+    with ThreadPoolExecutor(len(paths)) as executor:
+        futures = [
+            executor.submit(_write_shard, path, q, compression, failed)
+            for path, q in zip(paths, queues)
+        ]
+        try:
+            for i, record in enumerate(serialized.as_numpy_iterator()):
+                if failed.is_set():
+                    break
+                queues[i % len(queues)].put(record)
+        except:
+            failed.set()
+            raise
+        finally:
+            for q in queues:
+                q.put(None)
+        for future in futures:
+            future.result()
+
+
+def save_sharded(
+    dataset: tf.data.Dataset,
+    paths: Sequence[str],
+    compression: Optional[str] = None,
+    record_format: str = "tensor",
+    chunk_codec: Optional[str] = None,
+    chunk_size: int = 64,
+):
+    serialized = _serialize(dataset, record_format, chunk_codec, chunk_size)
+    save_serialized_sharded(serialized, paths=paths, compression=compression)
+
+
 def load(path: str, compression: Optional[str] = None):
     return tf.data.TFRecordDataset(path, compression_type=compression)
 
 
-def parse(loaded: tf.data.Dataset, spec, num_parallel_calls=1, deterministic=None):
+def load_sharded(paths: Sequence[str], compression: Optional[str] = None):
+    """Load shards saved with `save_sharded` in the original element order."""
+    return tf.data.TFRecordDataset(
+        list(paths), compression_type=compression, num_parallel_reads=len(paths)
+    )
+
+
+def parse(
+    loaded: tf.data.Dataset,
+    spec,
+    num_parallel_calls=1,
+    deterministic=None,
+    record_format: str = "tensor",
+    block_size: Optional[int] = None,
+):
+    if block_size is not None:
+        if record_format != "flat":
+            raise ValueError(
+                "block_size can only be used with flat records, got "
+                f"record_format={record_format}"
+            )
+        return parse_flat_blocks(
+            loaded,
+            spec,
+            block_size=block_size,
+            num_parallel_calls=num_parallel_calls,
+            deterministic=deterministic,
+        )
     return loaded.map(
-        deserializer(spec), num_parallel_calls, deterministic=deterministic
+        record_deserializer(spec, record_format),
+        num_parallel_calls,
+        deterministic=deterministic,
+    )
+
+
+def _pid_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _TmpRecordWriters:
+    """
+    Thread-safe collection of writers to temporary files committed on completion.
+
+    Temporary files are named `{path}.{hostname}-{pid}-{writer_id}.tmp`. Files left
+    by processes on the same host that are no longer running (e.g. preempted jobs)
+    are removed when a writer is opened.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        self._path = path
+        self._compression = compression
+        self._writers = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._prefix = f"{socket.gethostname()}-{os.getpid()}-"
+
+    def _tmp_path(self, writer_id: int) -> str:
+        return f"{self._path}.{self._prefix}{writer_id}.tmp"
+
+    def _remove_stale(self):
+        hostname = socket.gethostname()
+        for tmp_path in tf.io.gfile.glob(f"{self._path}.*.tmp"):
+            tag = tmp_path[len(self._path) + 1 : -len(".tmp")]
+            parts = tag.rsplit("-", 2)
+            if len(parts) != 3 or parts[0] != hostname or not parts[1].isdigit():
+                continue
+            if not _pid_running(int(parts[1])):
+                logging.info(f"Removing stale temporary file {tmp_path}")
+                try:
+                    tf.io.gfile.remove(tmp_path)
+                except tf.errors.NotFoundError:
+                    pass  # removed concurrently
+
+    def open(self) -> np.int64:
+        self._remove_stale()
+        with self._lock:
+            writer_id = self._next_id
+            self._next_id += 1
+            self._writers[writer_id] = tf.io.TFRecordWriter(
+                self._tmp_path(writer_id), options=self._compression
+            )
+        logging.info(f"Writing through to {self._path}")
+        return np.int64(writer_id)
+
+    def write(self, writer_id: np.int64, record: bytes) -> np.int64:
+        with self._lock:
+            writer = self._writers.get(int(writer_id))
+            if writer is not None:  # None if another iterator has committed
+                writer.write(record)
+        return writer_id
+
+    def commit(self, writer_id: np.int64) -> np.int64:
+        with self._lock:
+            if int(writer_id) not in self._writers:
+                return writer_id
+            # once committed, any other writers are either abandoned or redundant
+            writers, self._writers = self._writers, {}
+            for i, writer in writers.items():
+                writer.close()
+                if i != writer_id:
+                    tf.io.gfile.remove(self._tmp_path(i))
+            tf.io.gfile.rename(self._tmp_path(writer_id), self._path, overwrite=True)
+        logging.info(f"Finished writing {self._path}")
+        return writer_id
+
+
+def write_through_cache(
+    dataset: tf.data.Dataset,
+    path: str,
+    num_parallel_calls: int = 1,
+    compression: Optional[str] = None,
+    deterministic: Optional[bool] = None,
+    record_format: str = "tensor",
+    block_size: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Cache `dataset` in a tfrecords file populated while iterating.
+
+    Each time the returned dataset is iterated, it checks whether `path` exists. If
+    it does, elements are read from `path`. Otherwise, elements are taken from
+    `dataset` and simultaneously written to a temporary file which is renamed to
+    `path` if the iteration reaches the end of `dataset`. Incomplete iterations leave
+    `path` untouched, so partially written caches are never read.
+
+    Args:
+        dataset: dataset to cache. Must be finite.
+        path: path to tfrecords file.
+        num_parallel_calls: used in deserialization.
+        compression: compression type of tfrecord file.
+        deterministic: used in deserialization.
+        record_format: one of `RECORD_FORMATS`.
+        block_size: if given, "flat" records are decoded this many at a time.
+
+    Returns:
+        dataset with the same elements as `dataset`.
+    """
+    spec = dataset.element_spec
+    serializer = record_serializer(spec, record_format)
+    writers = _TmpRecordWriters(path, compression=compression)
+
+    def write_through(writer_id):
+        def map_func(*args):
+            record = serializer(*args)
+            written = tf.numpy_function(writers.write, (writer_id, record), tf.int64)
+            with tf.control_dependencies([written]):
+                return tf.nest.map_structure(
+                    tf.identity,
+                    args[0] if len(args) == 1 else args,
+                    expand_composites=True,
+                )
+
+        # only runs if `dataset` is exhausted, and never yields elements
+        commit = (
+            tf.data.Dataset.from_tensors(writer_id)
+            .map(lambda i: tf.numpy_function(writers.commit, (i,), tf.int64))
+            .filter(lambda i: i < 0)
+            .flat_map(lambda _: dataset.take(0))
+        )
+        return dataset.map(map_func).concatenate(commit)
+
+    def stream(complete):
+        return (
+            tf.data.Dataset.from_tensors(complete)
+            .filter(tf.logical_not)
+            .map(lambda _: tf.numpy_function(writers.open, (), tf.int64))
+            .flat_map(write_through)
+        )
+
+    def read(complete):
+        loaded = (
+            tf.data.Dataset.from_tensors(complete)
+            .filter(lambda complete: complete)
+            .flat_map(lambda _: load(path, compression=compression))
+        )
+        return parse(
+            loaded,
+            spec=spec,
+            num_parallel_calls=num_parallel_calls,
+            deterministic=deterministic,
+            record_format=record_format,
+            block_size=block_size,
+        )
+
+    def iteration(path):
+        # evaluated once per iteration so we never switch modes mid-iteration
+        complete = tf.size(tf.io.matching_files(path)) > 0
+        return stream(complete).concatenate(read(complete))
+
+    return (
+        tf.data.Dataset.from_tensors(path)
+        .flat_map(iteration)
+        .apply(tf.data.experimental.assert_cardinality(dataset.cardinality()))
     )
 
 
@@ -67,18 +646,102 @@ def tfrecords_cache(
     num_parallel_calls: int = 1,
     compression: Optional[str] = None,
     deterministic: Optional[bool] = None,
+    num_shards: Optional[int] = None,
+    record_format: str = "tensor",
+    block_size: Optional[int] = None,
+    write_through: bool = False,
+    chunk_codec: Optional[str] = None,
+    chunk_size: int = 64,
 ):
+    """
+    Cache `dataset` as tfrecords in `cache_dir`, writing files if missing.
+
+    Args:
+        dataset: dataset to cache.
+        cache_dir: directory to save files in.
+        num_parallel_calls: used in deserialization.
+        compression: compression type of tfrecord files.
+        deterministic: used in deserialization.
+        num_shards: if given, records are written to (and read from) this many
+            shards in parallel. Otherwise, a single file is used. Sharded caches must
+            be created in eager mode.
+        record_format: one of `RECORD_FORMATS`. "tensor" records are nested
+            `tf.io.serialize_tensor` protos, while "flat" records are the raw bytes
+            of each component behind a header of dynamic dimensions. "flat" records
+            are cheaper to decode but do not support string components.
+        block_size: if given, "flat" records are decoded this many at a time. See
+            `parse_flat_blocks`.
+        write_through: if True, files are written while iterating over `dataset`
+            the first time rather than up front. See `write_through_cache`. Not
+            compatible with `num_shards`.
+        chunk_codec: if given, records are grouped into chunks of `chunk_size` which
+            are compressed independently with this codec (one of `CHUNK_CODECS`).
+            Unlike `compression`, chunks are decompressed in parallel based on
+            `num_parallel_calls`. Not compatible with `write_through`.
+        chunk_size: number of records per chunk if `chunk_codec` is given.
+
+    Returns:
+        dataset with the same elements as `dataset`, read from the cache.
+    """
     if tf.executing_eagerly():
         tf.io.gfile.makedirs(cache_dir)
 
     cardinality = dataset.cardinality()
-    path = cache_dir + "/serialized.tfrecords"  # must work in graph mode
-    if tf.shape(tf.io.matching_files(path))[0] == 0:
-        logging.info(f"Saving tfrecords dataset to {path}")
-        save(dataset, path, compression=compression)
+    prefix = _prefix(record_format)
+    if chunk_codec is not None:
+        prefix = f"{prefix}-chunked{chunk_size}-{chunk_codec.lower() or 'raw'}"
+    if write_through:
+        if num_shards is not None:
+            raise ValueError("write_through caches cannot be sharded")
+        if chunk_codec is not None:
+            raise ValueError("write_through caches cannot be chunked")
+        return write_through_cache(
+            dataset,
+            f"{cache_dir}/{prefix}.tfrecords",
+            num_parallel_calls=num_parallel_calls,
+            compression=compression,
+            deterministic=deterministic,
+            record_format=record_format,
+            block_size=block_size,
+        )
+    if num_shards is None:
+        path = f"{cache_dir}/{prefix}.tfrecords"  # must work in graph mode
+        if tf.shape(tf.io.matching_files(path))[0] == 0:
+            logging.info(f"Saving tfrecords dataset to {path}")
+            save(
+                dataset,
+                path,
+                compression=compression,
+                record_format=record_format,
+                chunk_codec=chunk_codec,
+                chunk_size=chunk_size,
+            )
+        loaded = load(path, compression=compression)
+    else:
+        paths = shard_paths(cache_dir, num_shards, prefix=prefix)
+        if not all(tf.io.gfile.exists(p) for p in paths):
+            logging.info(f"Saving {num_shards} tfrecords shards to {cache_dir}")
+            save_sharded(
+                dataset,
+                paths,
+                compression=compression,
+                record_format=record_format,
+                chunk_codec=chunk_codec,
+                chunk_size=chunk_size,
+            )
+        loaded = load_sharded(paths, compression=compression)
+    if chunk_codec is not None:
+        loaded = decompress_chunks(
+            loaded,
+            chunk_codec,
+            num_parallel_calls=num_parallel_calls,
+            deterministic=deterministic,
+        )
     return parse(
-        load(path, compression=compression),
+        loaded,
         spec=dataset.element_spec,
         num_parallel_calls=num_parallel_calls,
         deterministic=deterministic,
+        record_format=record_format,
+        block_size=block_size,
     ).apply(tf.data.experimental.assert_cardinality(cardinality))
@@ -0,0 +1,153 @@
+import os
+import socket
+import subprocess
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from kblocks.data import tfrecords
+
+
+def as_list(dataset: tf.data.Dataset):
+    return list(dataset.as_numpy_iterator())
+
+
+def composite_dataset():
+    def map_func(x):
+        values = tf.range(x, dtype=tf.float32)
+        ragged = tf.RaggedTensor.from_row_lengths(
+            tf.reshape(tf.tile(values, (2,)), (-1, 1)), [x, x]
+        )
+        sparse = tf.SparseTensor(
+            tf.expand_dims(tf.range(x, dtype=tf.int64), 1) * 2,
+            tf.ones((x,), tf.int32),
+            tf.expand_dims(2 * x + 1, 0),
+        )
+        return (tf.fill((3, x % 4), x > 3), {"ragged": ragged, "sparse": sparse})
+
+    return tf.data.Dataset.range(7).map(map_func)
+
+
+def assert_nested_equal(actual, expected):
+    tf.nest.assert_same_structure(actual, expected, expand_composites=True)
+    for a, e in zip(
+        tf.nest.flatten(actual, expand_composites=True),
+        tf.nest.flatten(expected, expand_composites=True),
+    ):
+        np.testing.assert_equal(a.numpy(), e.numpy())
+
+
+class TfrecordsTest(tf.test.TestCase):
+    def test_flat_serialization(self):
+        dataset = composite_dataset()
+        spec = dataset.element_spec
+        serializer = tfrecords.flat_serializer(spec)
+        deserializer = tfrecords.flat_deserializer(spec)
+        for element in dataset:
+            actual = deserializer(serializer(*element))
+            assert_nested_equal(actual, element)
+
+    def test_flat_cache(self):
+        dataset = composite_dataset()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = tfrecords.tfrecords_cache(dataset, tmp_dir, record_format="flat")
+            self.assertEqual(cached.element_spec, dataset.element_spec)
+            for actual, expected in zip(cached, dataset):
+                assert_nested_equal(actual, expected)
+
+    def test_flat_blocks(self):
+        datasets = (
+            composite_dataset(),
+            tf.data.Dataset.range(7).map(lambda x: (tf.fill((2, 3), x), x > 2)),
+            tf.data.Dataset.range(7).map(lambda x: tf.zeros((x, 2, x + 1), tf.int16)),
+        )
+        for dataset in datasets:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cached = tfrecords.tfrecords_cache(
+                    dataset, tmp_dir, record_format="flat", block_size=3
+                )
+                self.assertEqual(cached.element_spec, dataset.element_spec)
+                np.testing.assert_equal(cached.cardinality().numpy(), 7)
+                for actual, expected in zip(cached, dataset):
+                    assert_nested_equal(actual, expected)
+
+    def test_sharded_cache(self):
+        num_shards = 3
+        dataset = tf.data.Dataset.range(11).map(
+            lambda x: (tf.fill((x % 4,), x), {"y": tf.cast(x, tf.float32)})
+        )
+        expected = as_list(dataset)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cached = tfrecords.tfrecords_cache(dataset, tmp_dir, num_shards=num_shards)
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)),
+                [os.path.basename(p) for p in tfrecords.shard_paths(tmp_dir, 3)],
+            )
+            np.testing.assert_equal(cached.cardinality().numpy(), 11)
+            for _ in range(2):
+                actual = as_list(cached)
+                self.assertEqual(len(actual), len(expected))
+                for a, e in zip(actual, expected):
+                    np.testing.assert_equal(a, e)
+
+    def test_chunked_cache(self):
+        dataset = composite_dataset()
+        for codec in tfrecords.CHUNK_CODECS:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cached = tfrecords.tfrecords_cache(
+                    dataset,
+                    tmp_dir,
+                    record_format="flat",
+                    block_size=2,
+                    chunk_codec=codec,
+                    chunk_size=3,
+                    num_parallel_calls=2,
+                )
+                np.testing.assert_equal(cached.cardinality().numpy(), 7)
+                for actual, expected in zip(cached, dataset):
+                    assert_nested_equal(actual, expected)
+
+    def test_write_through_cache(self):
+        dataset = composite_dataset()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.tfrecords")
+            cached = tfrecords.write_through_cache(dataset, path, record_format="flat")
+            self.assertEqual(cached.element_spec, dataset.element_spec)
+            np.testing.assert_equal(cached.cardinality().numpy(), 7)
+            # incomplete iteration isn't committed
+            next(iter(cached))
+            self.assertFalse(os.path.exists(path))
+            for actual, expected in zip(cached, dataset):
+                assert_nested_equal(actual, expected)
+            self.assertEqual(os.listdir(tmp_dir), ["cache.tfrecords"])
+            # ensure subsequent iterations read from file
+            empty = dataset.skip(7).apply(tf.data.experimental.assert_cardinality(7))
+            cached = tfrecords.write_through_cache(empty, path, record_format="flat")
+            self.assertEqual(len(as_list(cached)), 7)
+            for actual, expected in zip(cached, dataset):
+                assert_nested_equal(actual, expected)
+
+    def test_write_through_cache_removes_stale(self):
+        dataset = tf.data.Dataset.range(5)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache.tfrecords")
+            proc = subprocess.Popen(["true"])
+            proc.wait()
+            hostname = socket.gethostname()
+            stale = f"cache.tfrecords.{hostname}-{proc.pid}-0.tmp"
+            live = f"cache.tfrecords.{hostname}-{os.getppid()}-0.tmp"
+            other_host = f"cache.tfrecords.not-{hostname}-{proc.pid}-0.tmp"
+            for filename in (stale, live, other_host):
+                with open(os.path.join(tmp_dir, filename), "w"):
+                    pass
+            cached = tfrecords.write_through_cache(dataset, path)
+            self.assertEqual(as_list(cached), list(range(5)))
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)),
+                sorted(["cache.tfrecords", live, other_host]),
+            )
+
+
+if __name__ == "__main__":
+    tf.test.main()
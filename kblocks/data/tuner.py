@@ -0,0 +1,224 @@
+"""
+Trial-based tuning of gin-configured dataset pipelines.
+
+Candidate values for gin bindings (e.g. `kb.data.map_transform.num_parallel_calls`)
+are evaluated by building the pipeline under a gin config scope and measuring
+throughput and peak memory over a short trial. The best settings are reported as gin
+bindings and results are cached per host and pipeline fingerprint.
+"""
+import contextlib
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence
+
+import gin
+import psutil
+import tensorflow as tf
+from absl import logging
+
+from kblocks.data import fingerprint as fingerprint_lib
+from kblocks.path import expand
+
+_SCOPE_PREFIX = "kb_tuner"
+
+
+class PeakRSS:
+    """
+    Context manager sampling resident memory of this process in a thread.
+
+    Attributes:
+        baseline: resident memory on entry (bytes).
+        peak: peak resident memory while entered (bytes).
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.baseline = 0
+        self.peak = 0
+
+    @property
+    def increase(self) -> int:
+        """Peak resident memory above `baseline` (bytes)."""
+        return self.peak - self.baseline
+
+    def _run(self, process: psutil.Process):
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, process.memory_info().rss)
+
+    def __enter__(self):
+        process = psutil.Process()
+        self.baseline = self.peak = process.memory_info().rss
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(process,), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, psutil.Process().memory_info().rss)
+
+
+def run_trial(
+    dataset: tf.data.Dataset, num_elements: int = 100, num_warmup: int = 10
+) -> Dict[str, float]:
+    """
+    Measure throughput and peak resident memory while iterating over `dataset`.
+
+    Memory is measured relative to resident memory at the start of the trial, so
+    results of successive trials in the same process are comparable.
+
+    Args:
+        dataset: dataset to benchmark. Repeated if finite.
+        num_elements: number of elements to time.
+        num_warmup: number of elements taken before timing begins.
+
+    Returns:
+        dict with "elements_per_sec" and "peak_rss" (peak increase in resident
+        memory over the trial, in bytes).
+    """
+    if dataset.cardinality() != tf.data.INFINITE_CARDINALITY:
+        dataset = dataset.repeat()
+    with PeakRSS() as rss:
+        iterator = iter(dataset)
+        for _ in range(num_warmup):
+            next(iterator)
+        t = time.perf_counter()
+        for _ in range(num_elements):
+            next(iterator)
+        dt = time.perf_counter() - t
+        del iterator
+    return dict(elements_per_sec=num_elements / dt, peak_rss=rss.increase)
+
+
+def bindings_str(bindings: Mapping[str, Any]) -> str:
+    """Get gin config string for `bindings` mapping parameter names to values."""
+    return "\n".join(f"{k} = {v!r}" for k, v in bindings.items())
+
+
+@contextlib.contextmanager
+def _trial_scope(scope: str, bindings: Mapping[str, Any]):
+    """
+    Context manager binding `bindings` in gin config scope `scope` and entering it.
+
+    Bindings and operative config entries in `scope` are removed on exit. gin has no
+    public API for removing bindings, so this modifies its module-level state.
+    """
+    with gin.unlock_config():
+        for k, v in bindings.items():
+            gin.bind_parameter(f"{scope}/{k}", v)
+    try:
+        with gin.config_scope(scope):
+            yield
+    finally:
+        config = gin.config._CONFIG  # pylint: disable=protected-access
+        for key in [key for key in config if key[0] == scope]:
+            del config[key]
+        # pylint: disable=protected-access
+        with gin.config._OPERATIVE_CONFIG_LOCK:
+            operative = gin.config._OPERATIVE_CONFIG
+            for key in [key for key in operative if key[0] == scope]:
+                del operative[key]
+        # pylint: enable=protected-access
+
+
+def _cache_path(
+    cache_dir: str, dataset_fn: Callable[[], tf.data.Dataset], candidates
+) -> str:
+    key = fingerprint_lib.fingerprint(
+        dataset_fn(), configurables=(), extra=(repr(sorted(candidates.items())),)
+    )
+    return os.path.join(cache_dir, f"{socket.gethostname()}-{key}.json")
+
+
+@gin.configurable(module="kb.data")
+def tune_pipeline(
+    dataset_fn: Callable[[], tf.data.Dataset],
+    candidates: Mapping[str, Sequence[Any]],
+    num_elements: int = 100,
+    num_warmup: int = 10,
+    max_rss: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    apply_best: bool = False,
+) -> Dict[str, Any]:
+    """
+    Find the gin bindings giving the best throughput of the pipeline.
+
+    Each combination of `candidates` is bound in a separate gin config scope, within
+    which `dataset_fn` is called and the trial is run. Trial bindings are removed
+    from the config and operative config afterwards, so existing bindings are
+    unaffected.
+
+    Example usage:
+    ```python
+    best = tune_pipeline(
+        get_dataset,  # builds a pipeline with kb.data transforms
+        {
+            "kb.data.map_transform.num_parallel_calls": [1, 4, tf.data.AUTOTUNE],
+            "kb.data.prefetch.buffer_size": [1, tf.data.AUTOTUNE],
+        },
+    )
+    print(bindings_str(best))
+    ```
+
+    Args:
+        dataset_fn: function that builds the dataset using gin-configured transforms.
+        candidates: mapping from gin parameter names to candidate values.
+        num_elements: number of elements to time per trial.
+        num_warmup: number of elements to take before timing each trial.
+        max_rss: if given, candidates whose peak resident memory over their trial
+            increased by more than this many bytes are not considered.
+        cache_dir: if given, results are saved to / loaded from a file in this
+            directory based on the host name, the fingerprint of the default
+            pipeline and `candidates`.
+        apply_best: if True, the best bindings are applied globally.
+
+    Returns:
+        dict mapping gin parameter names to best values.
+    """
+    candidates = {k: list(v) for k, v in candidates.items()}
+    path = None
+    best = None
+    if cache_dir is not None:
+        cache_dir = expand(cache_dir)
+        path = _cache_path(cache_dir, dataset_fn, candidates)
+        if tf.io.gfile.exists(path):
+            with tf.io.gfile.GFile(path, "r") as fp:
+                best = json.load(fp)["best"]
+            logging.info(f"Loaded tuned bindings from {path}")
+
+    if best is None:
+        names = tuple(candidates)
+        results = []
+        for i, values in enumerate(itertools.product(*candidates.values())):
+            bindings = dict(zip(names, values))
+            scope = f"{_SCOPE_PREFIX}{i}"
+            with _trial_scope(scope, bindings):
+                # bindings may be used lazily, e.g. in `dataset_fn`'s tf.functions
+                result = run_trial(
+                    dataset_fn(), num_elements=num_elements, num_warmup=num_warmup
+                )
+            logging.info(f"Trial {i}: {bindings} -> {result}")
+            results.append(dict(bindings=bindings, **result))
+        valid = [r for r in results if max_rss is None or r["peak_rss"] <= max_rss]
+        if not valid:
+            raise RuntimeError(f"No candidates satisfied max_rss={max_rss}: {results}")
+        best = max(valid, key=lambda r: r["elements_per_sec"])["bindings"]
+        if path is not None:
+            tf.io.gfile.makedirs(cache_dir)
+            with tf.io.gfile.GFile(path, "w") as fp:
+                json.dump(dict(best=best, results=results), fp, indent=2)
+            logging.info(f"Saved tuning results to {path}")
+
+    logging.info(f"Best bindings:\n{bindings_str(best)}")
+    if apply_best:
+        with gin.unlock_config():
+            for k, v in best.items():
+                gin.bind_parameter(k, v)
+    return best
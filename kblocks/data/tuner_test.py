@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+import gin
+import tensorflow as tf
+
+from kblocks.data import core
+from kblocks.data.tuner import bindings_str, run_trial, tune_pipeline
+
+
+class TunerTest(tf.test.TestCase):
+    def tearDown(self):
+        gin.clear_config()
+        super().tearDown()
+
+    def test_tune_pipeline(self):
+        calls = []
+
+        def dataset_fn():
+            calls.append(None)
+            return tf.data.Dataset.range(1000).apply(
+                core.compound_transform(
+                    [
+                        core.map_transform(lambda x: x * 2),
+                        core.batch(batch_size=4),
+                        core.prefetch(buffer_size=1),
+                    ]
+                )
+            )
+
+        candidates = {
+            "kb.data.map_transform.num_parallel_calls": [1, 2],
+            "kb.data.prefetch.buffer_size": [1, tf.data.experimental.AUTOTUNE],
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            best = tune_pipeline(
+                dataset_fn, candidates, num_elements=10, cache_dir=tmp_dir
+            )
+            self.assertEqual(set(best), set(candidates))
+            for k, v in best.items():
+                self.assertIn(v, candidates[k])
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+            num_calls = len(calls)
+
+            # cached results don't require trials
+            cached = tune_pipeline(
+                dataset_fn,
+                candidates,
+                num_elements=10,
+                cache_dir=tmp_dir,
+                apply_best=True,
+            )
+            self.assertEqual(cached, best)
+            self.assertEqual(len(calls), num_calls + 1)  # once for fingerprint
+            for k, v in best.items():
+                self.assertEqual(gin.query_parameter(k), v)
+        gin.parse_config(bindings_str(best))
+
+    def test_trial_bindings_removed(self):
+        def dataset_fn():
+            return tf.data.Dataset.range(100).apply(core.prefetch())
+
+        tune_pipeline(
+            dataset_fn, {"kb.data.prefetch.buffer_size": [1, 2]}, num_elements=10
+        )
+        self.assertNotIn("kb_tuner", gin.config_str())
+        self.assertNotIn("kb_tuner", gin.operative_config_str())
+
+    def test_run_trial_rss_relative(self):
+        def dataset_fn(cached):
+            # 1MB elements
+            dataset = tf.data.Dataset.range(100).map(
+                lambda x: tf.fill((2 ** 18,), tf.cast(x, tf.float32))
+            )
+            return dataset.cache() if cached else dataset
+
+        large = run_trial(dataset_fn(True), num_elements=10, num_warmup=100)
+        small = run_trial(dataset_fn(False), num_elements=10, num_warmup=100)
+        self.assertGreater(large["peak_rss"], 50 * 2 ** 20)
+        self.assertLess(small["peak_rss"], large["peak_rss"] / 2)
+
+
+if __name__ == "__main__":
+    tf.test.main()
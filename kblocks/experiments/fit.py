@@ -7,6 +7,7 @@ import tensorflow as tf
 import kblocks.extras.callbacks as ecb
 import kblocks.keras.callbacks as kcb
 from kblocks.data.repeated import RepeatedData, dataset_and_steps
+from kblocks.data.seekable import SeekableData
 from kblocks.experiments.core import Experiment
 from kblocks.models import fit
 from kblocks.path import expand
@@ -142,7 +143,7 @@ class Fit(Experiment):
     def __init__(
         self,
         model: tf.keras.Model,
-        train_data: Union[tf.data.Dataset, RepeatedData],
+        train_data: Union[tf.data.Dataset, RepeatedData, SeekableData],
         steps_per_epoch: Optional[int] = None,
         epochs: int = 1,
         validation_data: Optional[Union[tf.data.Dataset, RepeatedData]] = None,
@@ -151,6 +152,7 @@ class Fit(Experiment):
         validation_freq: int = 1,
         verbose: bool = True,
         track_iterator: bool = False,
+        async_validation: bool = False,
         **kwargs,
     ):
         if not isinstance(model, tf.keras.Model):
@@ -161,9 +163,14 @@ class Fit(Experiment):
                     f"input spec(s) to a Model, got {model}"
                 )
         self._model = model
-        self._train_data, self._steps_per_epoch = dataset_and_steps(
-            train_data, steps_per_epoch
-        )
+        if isinstance(train_data, SeekableData):
+            assert steps_per_epoch in (None, train_data.steps_per_epoch)
+            self._train_data = train_data
+            self._steps_per_epoch = train_data.steps_per_epoch
+        else:
+            self._train_data, self._steps_per_epoch = dataset_and_steps(
+                train_data, steps_per_epoch
+            )
         self._validation_data, self._validation_steps = dataset_and_steps(
             validation_data, validation_steps
         )
@@ -172,6 +179,7 @@ class Fit(Experiment):
         self._validation_freq = validation_freq
         self._track_iterator = track_iterator
         self._verbose = verbose
+        self._async_validation = async_validation
         super().__init__(**kwargs)
 
     def _run(self, start_status):
@@ -186,4 +194,5 @@ class Fit(Experiment):
             validation_freq=self._validation_freq,
             track_iterator=self._track_iterator,
             verbose=self._verbose,
+            async_validation=self._async_validation,
         )
@@ -1,12 +1,21 @@
 from .backup import BackupAndRestore
-from .logger import AbslLogger, LearningRateLogger, PrintLogger, YamlLogger
+from .logger import (
+    AbslLogger,
+    LearningRateLogger,
+    PrintLogger,
+    ThrottledProgbarLogger,
+    YamlLogger,
+)
 from .modules import EarlyStoppingModule, ReduceLROnPlateauModule, get
+from .pipeline import PipelineStatsLogger
 from .seeder import GeneratorSeeder, GlobalSeeder
 
 __all__ = [
     "AbslLogger",
     "LearningRateLogger",
     "PrintLogger",
+    "PipelineStatsLogger",
+    "ThrottledProgbarLogger",
     "YamlLogger",
     "BackupAndRestore",
     "EarlyStoppingModule",
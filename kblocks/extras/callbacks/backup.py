@@ -1,14 +1,57 @@
-from typing import Mapping
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Mapping, Optional
 
 import gin
+import numpy as np
 import tensorflow as tf
 
+from kblocks.utils import write_json
+
+MANIFEST = "manifest.json"
+
+
+def _tensor_hash(value) -> str:
+    if isinstance(value, bytes):
+        return hashlib.sha1(value).hexdigest()
+    value = np.asarray(value)
+    h = hashlib.sha1(f"{value.dtype}{value.shape}".encode())
+    if value.dtype == object:
+        for v in value.flat:
+            h.update(v)
+    else:
+        h.update(np.ascontiguousarray(value).tobytes())
+    return h.hexdigest()
+
 
 class TrainingState:
     """
     Alternative implementation of internal tensorflow `WorkerTrainingState`.
 
     Allows for arbitrary modules to be saved, rather than just `model`.
+
+    Backups may be made part-way through an epoch. The position - the last completed
+    epoch and the number of steps completed in the following epoch - is saved in the
+    checkpoint. Checkpoints are numbered by the number of backups made.
+
+    If `async_backup` is True, `back_up` writes a checkpoint to `staging_dir` (by
+    default an in-memory `ram://` filesystem) and returns, while a background thread
+    moves it to `checkpoint_dir`. At most one write is in flight - `back_up` waits for
+    the previous one before staging a new snapshot. The checkpoint state file is only
+    updated once all files of a checkpoint have been moved, so `restore` after
+    preemption always sees a complete checkpoint. `saved_epoch` is the most recently
+    backed up epoch, which may still be in flight. Use `wait` to block until it is
+    written.
+
+    If `incremental` is True, each backup only writes tensors that have changed since
+    the previous backup to a `delta-{number}` checkpoint, and a manifest records which
+    delta each tensor of each backup is in. Tensors are compared by hash. Deltas are
+    deleted once no backup within the most recent `max_to_keep` references them.
+    Restoring assembles a full checkpoint in `staging_dir` from the referenced deltas.
     """
 
     def __init__(
@@ -17,40 +60,234 @@ class TrainingState:
         checkpoint_dir: str,
         max_to_keep: int = 1,
         keep_checkpoint_every_n_hours=None,
+        async_backup: bool = False,
+        staging_dir: Optional[str] = None,
+        incremental: bool = False,
     ):
-        checkpoint = tf.train.Checkpoint(**modules)
+        if (async_backup or incremental) and keep_checkpoint_every_n_hours is not None:
+            raise ValueError(
+                "keep_checkpoint_every_n_hours not supported with async_backup or "
+                "incremental"
+            )
+        self._position = tf.Module()
+        self._position.epoch = tf.Variable(-1, dtype=tf.int64, trainable=False)
+        self._position.step = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self._position.count = tf.Variable(0, dtype=tf.int64, trainable=False)
+        checkpoint = tf.train.Checkpoint(backup_position=self._position, **modules)
+        self._checkpoint = checkpoint
         self._manager = tf.train.CheckpointManager(
             checkpoint,
             directory=checkpoint_dir,
             max_to_keep=max_to_keep,
             keep_checkpoint_every_n_hours=keep_checkpoint_every_n_hours,
         )
+        self._max_to_keep = max_to_keep
         self._saved_epoch = -1
+        self._saved_step = 0
+        self._async_backup = async_backup
+        self._incremental = incremental
+        self._staging_dir = staging_dir or f"ram://kblocks-backup-{uuid.uuid4()}"
+        if async_backup:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._future: Optional[Future] = None
+            ckpt_state = tf.train.get_checkpoint_state(checkpoint_dir)
+            self._checkpoints: List[str] = (
+                []
+                if ckpt_state is None
+                else list(ckpt_state.all_model_checkpoint_paths)
+            )
 
     @property
     def saved_epoch(self):
+        """Last completed epoch of the most recent backup."""
         return self._saved_epoch
 
-    def back_up(self, epoch: int):
-        self._manager.save(checkpoint_number=epoch)
+    @property
+    def saved_step(self):
+        """Steps completed in epoch `saved_epoch + 1` of the most recent backup."""
+        return self._saved_step
+
+    def back_up(self, epoch: int, step: int = 0):
+        """
+        Back up training state.
+
+        Args:
+            epoch: last completed epoch.
+            step: number of steps completed in epoch `epoch + 1`.
+        """
+        self.wait()
+        self._position.epoch.assign(epoch)
+        self._position.step.assign(step)
+        number = int(self._position.count.assign_add(1).numpy())
+        if self._async_backup or self._incremental:
+            staged = self._checkpoint.write(
+                os.path.join(self._staging_dir, f"ckpt-{number}")
+            )
+            commit = self._commit_incremental if self._incremental else self._commit
+            if self._async_backup:
+                self._future = self._executor.submit(commit, staged, number)
+            else:
+                commit(staged, number)
+        else:
+            self._manager.save(checkpoint_number=number)
         self._saved_epoch = epoch
+        self._saved_step = step
+
+    def _commit(self, staged: str, number: int):
+        directory = self._manager.directory
+        tf.io.gfile.makedirs(directory)
+        prefix = os.path.join(directory, f"ckpt-{number}")
+        for src in tf.io.gfile.glob(f"{staged}.*"):
+            dst = prefix + src[len(staged) :]
+            tf.io.gfile.copy(src, f"{dst}.tmp", overwrite=True)
+            tf.io.gfile.rename(f"{dst}.tmp", dst, overwrite=True)
+            tf.io.gfile.remove(src)
+        checkpoints = [c for c in self._checkpoints if c != prefix] + [prefix]
+        if self._max_to_keep is not None:
+            removed = checkpoints[: -self._max_to_keep]
+            checkpoints = checkpoints[-self._max_to_keep :]
+        else:
+            removed = []
+        tf.compat.v1.train.update_checkpoint_state(
+            directory, prefix, all_model_checkpoint_paths=checkpoints
+        )
+        self._checkpoints = checkpoints
+        for path in removed:
+            for filename in tf.io.gfile.glob(f"{path}.*"):
+                tf.io.gfile.remove(filename)
+
+    def _read_manifest(self) -> List[Dict]:
+        path = os.path.join(self._manager.directory, MANIFEST)
+        if not tf.io.gfile.exists(path):
+            return []
+        with tf.io.gfile.GFile(path, "r") as fp:
+            return json.load(fp)["backups"]
+
+    def _commit_incremental(self, staged: str, number: int):
+        directory = self._manager.directory
+        tf.io.gfile.makedirs(directory)
+        backups = self._read_manifest()
+        previous = backups[-1]["tensors"] if backups else {}
+        reader = tf.compat.v1.train.NewCheckpointReader(staged)
+        dtypes = reader.get_variable_to_dtype_map()
+        tensors = {}
+        changed = {}
+        for key in sorted(dtypes):
+            value = reader.get_tensor(key)
+            digest = _tensor_hash(value)
+            if key in previous and previous[key][1] == digest:
+                tensors[key] = previous[key]
+            else:
+                tensors[key] = [number, digest]
+                changed[key] = value
+        if changed:
+            keys = sorted(changed)
+            tf.raw_ops.SaveV2(
+                prefix=os.path.join(directory, f"delta-{number}"),
+                tensor_names=keys,
+                shape_and_slices=[""] * len(keys),
+                tensors=[tf.constant(changed[k], dtype=dtypes[k]) for k in keys],
+            )
+        for filename in tf.io.gfile.glob(f"{staged}.*"):
+            tf.io.gfile.remove(filename)
+
+        backups.append(dict(number=number, tensors=tensors))
+        if self._max_to_keep is not None:
+            backups = backups[-self._max_to_keep :]
+        # the manifest is written last, so it only references complete deltas
+        write_json(os.path.join(directory, MANIFEST), dict(backups=backups))
+        referenced = {src for b in backups for src, _ in b["tensors"].values()}
+        for filename in tf.io.gfile.glob(os.path.join(directory, "delta-*")):
+            src = int(os.path.basename(filename).split(".")[0].split("-")[1])
+            if src not in referenced:
+                tf.io.gfile.remove(filename)
+
+    def _restore_incremental(self) -> Optional[str]:
+        backups = self._read_manifest()
+        if not backups:
+            return None
+        latest = backups[-1]
+        keys_by_src = {}
+        for key, (src, _) in latest["tensors"].items():
+            keys_by_src.setdefault(src, []).append(key)
+        names = []
+        values = []
+        for src, keys in keys_by_src.items():
+            reader = tf.train.load_checkpoint(
+                os.path.join(self._manager.directory, f"delta-{src}")
+            )
+            dtypes = reader.get_variable_to_dtype_map()
+            for key in keys:
+                names.append(key)
+                values.append(tf.constant(reader.get_tensor(key), dtype=dtypes[key]))
+        prefix = os.path.join(self._staging_dir, f"restore-{latest['number']}")
+        tf.raw_ops.SaveV2(
+            prefix=prefix,
+            tensor_names=names,
+            shape_and_slices=[""] * len(names),
+            tensors=values,
+        )
+        # not removed, since restoration of variables created later is deferred
+        self._checkpoint.restore(prefix)
+        return prefix
+
+    def wait(self):
+        """Block until any in-flight backup has been written."""
+        if self._async_backup and self._future is not None:
+            future = self._future
+            self._future = None
+            future.result()
 
     def restore(self):
-        path = self._manager.restore_or_initialize()
+        self.wait()
+        if self._incremental:
+            path = self._restore_incremental()
+        else:
+            path = self._manager.restore_or_initialize()
         if path is not None:
-            self._saved_epoch = int(path.split("-")[-1])
+            number = int(path.split("-")[-1])
+            if self._position.count.numpy() == 0:
+                # saved without position, numbered by epoch
+                self._position.count.assign(number)
+                self._saved_epoch = number
+                self._saved_step = 0
+            else:
+                self._saved_epoch = int(self._position.epoch.numpy())
+                self._saved_step = int(self._position.step.numpy())
 
     def delete_backup(self):
+        self.wait()
         tf.io.gfile.rmtree(self._manager.directory)
 
     def maybe_load_initial_epoch_from_ckpt(self, initial_epoch: int, mode: str) -> int:
-        if mode == "train" and self._saved_epoch > 0:
+        if mode == "train" and self._saved_epoch >= 0:
             return self._saved_epoch + 1
         return initial_epoch
 
+    def maybe_load_initial_step_from_ckpt(self, initial_epoch: int) -> int:
+        """
+        Get the step to resume `initial_epoch` from.
+
+        This may be the number of steps in an epoch if a backup was made after the
+        final step of an epoch but before the epoch was completed.
+        """
+        if initial_epoch == self._saved_epoch + 1:
+            return self._saved_step
+        return 0
+
 
 @gin.configurable(module="kb.callbacks")
 class BackupAndRestore(tf.keras.callbacks.Callback):
+    """
+    Back up training state each `checkpoint_interval` epochs and restore on start.
+
+    If `save_freq_steps` or `save_freq_secs` are given, backups are also made from
+    batch hooks after that many steps or seconds since the last backup. When
+    training with `kblocks.models.fit`, training resumes from the exact step of the
+    restored backup. For the data to resume from the same position, use
+    `kblocks.data.SeekableData` or `track_iterator=True`.
+    """
+
     def __init__(
         self,
         directory: str,
@@ -58,32 +295,75 @@ class BackupAndRestore(tf.keras.callbacks.Callback):
         keep_checkpoint_every_n_hours=None,
         checkpoint_interval: int = 1,
         remove_after_training: bool = False,
+        async_backup: bool = False,
+        staging_dir: Optional[str] = None,
+        incremental: bool = False,
+        save_freq_steps: Optional[int] = None,
+        save_freq_secs: Optional[float] = None,
     ):
         self._state_kwargs = dict(
             checkpoint_dir=directory,
             max_to_keep=max_to_keep,
             keep_checkpoint_every_n_hours=keep_checkpoint_every_n_hours,
+            async_backup=async_backup,
+            staging_dir=staging_dir,
+            incremental=incremental,
         )
         self._checkpoint_interval = checkpoint_interval
         self._training_state = None
         self._remove_after_training = remove_after_training
         self._last_epoch = -1
+        self._save_freq_steps = save_freq_steps
+        self._save_freq_secs = save_freq_secs
+        self._epoch = 0
+        self._last_save_step = 0
+        self._last_save_time = None
         super().__init__()
 
+    def _implements_train_batch_hooks(self):
+        return self._save_freq_steps is not None or self._save_freq_secs is not None
+
+    def _back_up(self, epoch: int, step: int = 0):
+        self._training_state.back_up(epoch, step)
+        self._last_save_step = step
+        self._last_save_time = time.monotonic()
+
     def _save(self, epoch: int):
         assert epoch != self._training_state.saved_epoch
-        self._training_state.back_up(epoch)
+        self._back_up(epoch)
 
     def _maybe_save(self, epoch: int, interval=None):
         last_saved = self._training_state.saved_epoch
         if epoch - last_saved >= (interval or self._checkpoint_interval):
-            self._training_state.back_up(epoch)
+            self._back_up(epoch)
 
     def on_train_begin(self, logs=None):
         state = TrainingState(dict(model=self.model), **self._state_kwargs)
         self._training_state = state
         self.model._training_state = state  # pylint: disable=protected-access
         state.restore()
+        self._last_save_time = time.monotonic()
+
+    def on_epoch_begin(self, epoch: int, logs=None):
+        self._epoch = epoch
+        self._last_save_step = self._training_state.maybe_load_initial_step_from_ckpt(
+            epoch
+        )
+
+    def on_train_batch_end(self, batch: int, logs=None):
+        step = batch + 1
+        if (
+            self._save_freq_steps is not None
+            and step - self._last_save_step >= self._save_freq_steps
+        ) or (
+            self._save_freq_secs is not None
+            and time.monotonic() - self._last_save_time >= self._save_freq_secs
+        ):
+            if step == self.params.get("steps"):
+                # end of epoch, so resume from the start of the next one
+                self._back_up(self._epoch, 0)
+            else:
+                self._back_up(self._epoch - 1, step)
 
     def on_epoch_end(self, epoch: int, logs=None):
         self._maybe_save(epoch)
@@ -94,6 +374,7 @@ class BackupAndRestore(tf.keras.callbacks.Callback):
             self._training_state.delete_backup()
         else:
             self._maybe_save(self._last_epoch, 1)
+            self._training_state.wait()
 
 
 # def restore(model: tf.keras.Model, backup_dir: str) -> int:
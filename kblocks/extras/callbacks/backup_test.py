@@ -0,0 +1,171 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+
+from kblocks import models
+from kblocks.extras.callbacks.backup import BackupAndRestore, TrainingState
+
+
+class TrainingStateTest(tf.test.TestCase, parameterized.TestCase):
+    def test_async_backup(self):
+        checkpoint_dir = os.path.join(self.get_temp_dir(), "backup")
+        module = tf.Module()
+        module.v = tf.Variable(np.zeros((3,), np.float32))
+        state = TrainingState(
+            dict(module=module), checkpoint_dir, max_to_keep=2, async_backup=True
+        )
+        for epoch in range(4):
+            module.v.assign_add(tf.ones((3,)))
+            state.back_up(epoch)
+            # changes after back_up are not saved
+            module.v.assign(tf.fill((3,), -1.0))
+            module.v.assign(tf.fill((3,), float(epoch + 1)))
+        self.assertEqual(state.saved_epoch, 3)
+        state.wait()
+        self.assertEqual(
+            sorted(
+                os.path.basename(p) for p in tf.io.gfile.glob(f"{checkpoint_dir}/*")
+            ),
+            [
+                "checkpoint",
+                "ckpt-3.data-00000-of-00001",
+                "ckpt-3.index",
+                "ckpt-4.data-00000-of-00001",
+                "ckpt-4.index",
+            ],
+        )
+
+        restored = tf.Module()
+        restored.v = tf.Variable(np.zeros((3,), np.float32))
+        restored_state = TrainingState(
+            dict(module=restored), checkpoint_dir, max_to_keep=2, async_backup=True
+        )
+        restored_state.restore()
+        self.assertEqual(restored_state.saved_epoch, 3)
+        self.assertAllEqual(restored.v.numpy(), [4, 4, 4])
+
+        # continues bookkeeping of existing checkpoints
+        restored_state.back_up(4)
+        restored_state.wait()
+        self.assertEqual(
+            tf.train.get_checkpoint_state(checkpoint_dir).all_model_checkpoint_paths,
+            [os.path.join(checkpoint_dir, f"ckpt-{i}") for i in (4, 5)],
+        )
+        self.assertFalse(tf.io.gfile.exists(f"{checkpoint_dir}/ckpt-3.index"))
+
+    def test_step_backup(self):
+        checkpoint_dir = os.path.join(self.get_temp_dir(), "backup")
+        module = tf.Module()
+        module.v = tf.Variable(0.0)
+        state = TrainingState(dict(module=module), checkpoint_dir)
+        state.back_up(1)
+        module.v.assign(1.0)
+        state.back_up(1, 5)
+
+        restored_state = TrainingState(dict(module=module), checkpoint_dir)
+        restored_state.restore()
+        self.assertEqual(restored_state.saved_epoch, 1)
+        self.assertEqual(restored_state.saved_step, 5)
+        self.assertEqual(
+            restored_state.maybe_load_initial_epoch_from_ckpt(0, "train"), 2
+        )
+        self.assertEqual(restored_state.maybe_load_initial_step_from_ckpt(2), 5)
+        self.assertEqual(restored_state.maybe_load_initial_step_from_ckpt(3), 0)
+
+    @parameterized.parameters(False, True)
+    def test_incremental_backup(self, async_backup):
+        checkpoint_dir = os.path.join(self.get_temp_dir(), f"backup-{async_backup}")
+
+        def get_state():
+            module = tf.Module()
+            module.frozen = tf.Variable(np.arange(1000, dtype=np.float32))
+            module.v = tf.Variable(0.0)
+            state = TrainingState(
+                dict(module=module),
+                checkpoint_dir,
+                max_to_keep=2,
+                async_backup=async_backup,
+                incremental=True,
+            )
+            return module, state
+
+        module, state = get_state()
+        for epoch in range(4):
+            module.v.assign(float(epoch))
+            state.back_up(epoch)
+        state.wait()
+
+        # only the first delta contains `frozen`
+        def delta_keys(number):
+            prefix = os.path.join(checkpoint_dir, f"delta-{number}")
+            return [k for k, _ in tf.train.list_variables(prefix)]
+
+        self.assertTrue(any("frozen" in k for k in delta_keys(1)))
+        self.assertFalse(any("frozen" in k for k in delta_keys(4)))
+        # delta-2 is no longer referenced
+        self.assertEqual(
+            sorted(
+                os.path.basename(p).split(".")[0]
+                for p in tf.io.gfile.glob(f"{checkpoint_dir}/delta-*.index")
+            ),
+            ["delta-1", "delta-3", "delta-4"],
+        )
+
+        restored, restored_state = get_state()
+        restored.frozen.assign(tf.zeros((1000,)))
+        restored_state.restore()
+        self.assertEqual(restored_state.saved_epoch, 3)
+        self.assertAllEqual(restored.frozen.numpy(), np.arange(1000))
+        self.assertEqual(restored.v.numpy(), 3.0)
+
+
+class Preempted(Exception):
+    pass
+
+
+class PreemptDuringValidation(tf.keras.callbacks.Callback):
+    def on_test_begin(self, logs=None):
+        raise Preempted()
+
+
+class BackupAndRestoreTest(tf.test.TestCase):
+    def test_resume_after_final_step_backup(self):
+        backup_dir = os.path.join(self.get_temp_dir(), "backup")
+        x = np.random.default_rng(0).normal(size=(20, 3)).astype(np.float32)
+        dataset = tf.data.Dataset.from_tensor_slices((x, x.sum(axis=1))).batch(2)
+
+        def fit(callbacks):
+            model = tf.keras.Sequential([tf.keras.layers.Dense(1, input_shape=(3,))])
+            models.compiled(model, loss="mse", optimizer="sgd")
+            backup = BackupAndRestore(backup_dir, save_freq_steps=5)
+            history = models.fit(
+                model,
+                dataset,
+                epochs=2,
+                validation_data=dataset,
+                callbacks=[backup, *callbacks],
+                verbose=False,
+            )
+            return model, history
+
+        # preempted after the step backup at the end of epoch 0
+        with self.assertRaises(Preempted):
+            fit([PreemptDuringValidation()])
+        model, history = fit([])
+        self.assertEqual(history.epoch, [1])
+        self.assertEqual(model.optimizer.iterations.numpy(), 20)
+
+        # backups of the final step not normalized to the next epoch
+        tf.io.gfile.rmtree(backup_dir)
+        model = tf.keras.Sequential([tf.keras.layers.Dense(1, input_shape=(3,))])
+        models.compiled(model, loss="mse", optimizer="sgd")
+        TrainingState(dict(model=model), backup_dir).back_up(0, 10)
+        model, history = fit([])
+        self.assertEqual(history.epoch, [1])
+        self.assertEqual(model.optimizer.iterations.numpy(), 0)
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -1,3 +1,4 @@
+import time
 from typing import Callable
 
 import gin
@@ -87,3 +88,47 @@ class LearningRateLogger(tf.keras.callbacks.Callback):
     @classmethod
     def from_config(cls, config):
         return cls(**config)
+
+
+@gin.configurable(module="kb.callbacks")
+@register_serializable
+class ThrottledProgbarLogger(tf.keras.callbacks.ProgbarLogger):
+    """
+    `ProgbarLogger` that updates at most once every `interval` seconds.
+
+    `ProgbarLogger` converts logs to numpy values on each batch, which forces a
+    device sync and adds python overhead to every step. This updates the progress bar
+    with the most recent logs at most once every `interval` seconds and at the end
+    of each epoch.
+    """
+
+    def __init__(self, interval: float = 1.0, count_mode: str = "steps", **kwargs):
+        self._interval = interval
+        self._last_update = None
+        self._last_batch = None
+        super().__init__(count_mode=count_mode, **kwargs)
+
+    def get_config(self):
+        return dict(interval=self._interval, count_mode="steps")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._last_update = time.perf_counter()
+        super().on_epoch_begin(epoch, logs)
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._last_batch = batch
+        now = time.perf_counter()
+        if self._last_update is None or now - self._last_update >= self._interval:
+            self._last_update = now
+            super().on_train_batch_end(batch, logs)
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self._last_batch is not None:
+            # account for skipped updates
+            self.seen = self._last_batch + 1
+            self._last_batch = None
+        super().on_epoch_end(epoch, logs)
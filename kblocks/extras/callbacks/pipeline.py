@@ -0,0 +1,47 @@
+from typing import Optional
+
+import gin
+import tensorflow as tf
+
+from kblocks.data.instrument import get_pipeline_stats
+from kblocks.serialize import register_serializable
+
+
+@gin.configurable(module="kb.callbacks")
+@register_serializable
+class PipelineStatsLogger(tf.keras.callbacks.Callback):
+    """
+    Log statistics from `kb.data.instrumented_transform` pipelines each epoch.
+
+    Statistics are logged with absl logging and, if `log_dir` is given, written as
+    TensorBoard scalars. Statistics are reset after each epoch.
+    """
+
+    def __init__(self, stats_name: str = "default", log_dir: Optional[str] = None):
+        self._stats_name = stats_name
+        self._log_dir = log_dir
+        self._writer = None
+        super().__init__()
+
+    def get_config(self):
+        return dict(stats_name=self._stats_name, log_dir=self._log_dir)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+    def on_train_begin(self, logs=None):
+        if self._log_dir is not None:
+            self._writer = tf.summary.create_file_writer(self._log_dir)
+
+    def on_epoch_end(self, epoch, logs=None):
+        stats = get_pipeline_stats(self._stats_name)
+        if self._writer is not None:
+            with self._writer.as_default():
+                stats.write_scalars(epoch)
+        stats.log(reset=True)
+
+    def on_train_end(self, logs=None):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -1,9 +1,14 @@
 """gin wrappers around `tf.keras.Model` methods with tweaks for best-practices."""
-from typing import Iterable, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple, Union
 
 import gin
 import tensorflow as tf
 
+from kblocks.data import metadata
+from kblocks.data.seekable import SeekableData
+from kblocks.extras.callbacks.logger import ThrottledProgbarLogger
+
 
 @gin.configurable(module="kb.models")
 def compiled(
@@ -12,7 +17,7 @@ def compiled(
     metrics=None,
     optimizer=None,
     run_eagerly: Optional[bool] = None,
-    # steps_per_execution: Optional[int] = None,
+    steps_per_execution: Optional[int] = None,
 ) -> tf.keras.Model:
     """Mutate model in-place by compiling and return the model for convenience."""
     model.compile(
@@ -20,7 +25,7 @@ def compiled(
         metrics=metrics,
         optimizer=optimizer,
         run_eagerly=run_eagerly,
-        # steps_per_execution=steps_per_execution,
+        steps_per_execution=steps_per_execution,
     )
     return model
 
@@ -87,7 +92,7 @@ def as_infinite_iterator(
     Raises:
         ValueError is dataset has finite cardinality inconsistent with steps_per_epoch.
     """
-    cardinality = tf.keras.backend.get_value(dataset.cardinality())
+    cardinality = metadata.cardinality(dataset)
     if steps_per_epoch is None:
         steps_per_epoch = cardinality
         if cardinality == tf.data.INFINITE_CARDINALITY:
@@ -102,9 +107,99 @@ def as_infinite_iterator(
     return iter(dataset), steps_per_epoch
 
 
+def _clone_metric(metric):
+    if isinstance(metric, tf.keras.metrics.Metric):
+        return type(metric).from_config(metric.get_config())
+    return metric
+
+
+class _AsyncValidator:
+    """
+    Validates snapshots of a model's weights in a background thread.
+
+    Snapshots are evaluated with a compiled clone of the model, so the model being
+    trained and its metrics are unaffected. At most one validation is in flight.
+    """
+
+    def __init__(
+        self,
+        model: tf.keras.Model,
+        validation_data: tf.data.Dataset,
+        validation_steps: Optional[int] = None,
+        device: Optional[str] = None,
+    ):
+        # pylint: disable=protected-access
+        try:
+            clone = tf.keras.models.clone_model(model)
+        except ValueError as e:
+            raise ValueError(
+                "async validation requires a model that can be cloned with "
+                "`tf.keras.models.clone_model`"
+            ) from e
+        clone.compile(
+            loss=model.compiled_loss._user_losses,
+            loss_weights=model.compiled_loss._user_loss_weights,
+            metrics=tf.nest.map_structure(
+                _clone_metric, model.compiled_metrics._user_metrics
+            ),
+            weighted_metrics=tf.nest.map_structure(
+                _clone_metric, model.compiled_metrics._user_weighted_metrics
+            ),
+        )
+        # pylint: enable=protected-access
+        self._model = model
+        self._clone = clone
+        self._validation_data = validation_data
+        self._validation_steps = validation_steps
+        self._device = device
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = None
+        self._epoch = None
+
+    def _evaluate(self):
+        with tf.device(self._device):
+            return self._clone.evaluate(
+                self._validation_data,
+                steps=self._validation_steps,
+                verbose=0,
+                return_dict=True,
+            )
+
+    def submit(self, epoch: int):
+        """Start validating the current weights of the model as those of `epoch`."""
+        assert self._future is None
+        self._clone.set_weights(self._model.get_weights())
+        self._epoch = epoch
+        self._future = self._executor.submit(self._evaluate)
+
+    def result(self) -> Dict[str, float]:
+        """
+        Wait for the in-flight validation, if any, and get its logs.
+
+        Logs are prefixed with "val_" and include "val_epoch", the epoch the weights
+        were submitted as. Returns an empty dict if nothing is in flight.
+        """
+        if self._future is None:
+            return {}
+        logs = self._future.result()
+        self._future = None
+        logs = {"val_" + name: val for name, val in logs.items()}
+        logs["val_epoch"] = self._epoch
+        return logs
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _implements_train_batch_hooks(callback: tf.keras.callbacks.Callback) -> bool:
+    implements = getattr(callback, "_implements_train_batch_hooks", None)
+    # assume hooks are required for callbacks from older keras versions
+    return True if implements is None else implements()
+
+
 def fit(
     model: tf.keras.Model,
-    train_data: tf.data.Dataset,
+    train_data: Union[tf.data.Dataset, SeekableData],
     epochs: int = 1,
     steps_per_epoch: Optional[int] = None,
     validation_data: tf.data.Dataset = None,
@@ -114,6 +209,9 @@ def fit(
     validation_freq: int = 1,
     track_iterator: bool = False,
     verbose: bool = True,
+    progbar_interval: float = 1.0,
+    async_validation: bool = False,
+    validation_device: Optional[str] = None,
 ) -> tf.keras.callbacks.History:
     """
     Custom fit implementation.
@@ -124,9 +222,32 @@ def fit(
     using `tf.train.Checkpoint`s to manage training state, this may result in larger
     files on disk.
 
+    If `train_data` is a `SeekableData`, it is added as an attribute to `model` instead
+    and its iterator is created after `on_train_begin`, so only its position is saved
+    in and restored from checkpoints of `model`. Training resumes from the restored
+    position.
+
+    If `model` was compiled with `steps_per_execution=K`, each call to the train
+    function runs `K` steps (fewer at the end of an epoch) and batch hooks are called
+    once per call with the first and last step respectively, as in
+    `tf.keras.Model.fit`. If no callbacks implement train batch hooks, they are not
+    called at all. The progress bar is updated at most once every `progbar_interval`
+    seconds.
+
+    If `async_validation` is True, validation runs in a background thread on a
+    snapshot of the weights taken at the end of each validated epoch, while training
+    continues. Validation logs are then delivered late: logs passed to `on_epoch_end`
+    include those of the most recent completed validation (usually that of the
+    previous validated epoch) with an additional "val_epoch" entry giving the epoch
+    they correspond to. Validation of the final epoch is waited for and included in
+    its logs. If training is stopped early, any in-flight validation is included in
+    the logs passed to `on_train_end`. This requires a model that can be cloned with
+    `tf.keras.models.clone_model`.
+
     Args:
         model: keras model to train.
-        train_data: dataset with (inputs, labels) or (inputs, labels, sample_weights)
+        train_data: dataset with (inputs, labels) or (inputs, labels, sample_weights),
+            or `SeekableData` of such elements.
         epochs: total number of epochs to train until.
         steps_per_epoch: number of steps per epoch. Must be provided if train_data has
             infinite cardinality.
@@ -138,6 +259,10 @@ def fit(
         track_iterator: if True, `train_data`'s iterator is added as an attribute to
             `model`, meaning it will be saved in checkpoint's saving `model`.
         verbose: controls verbosity of printed output.
+        progbar_interval: minimum time in seconds between progress bar updates.
+        async_validation: if True, validation is overlapped with training (see
+            above).
+        validation_device: device to run async validation on, e.g. "/cpu:0".
 
     Returns:
         `tf.keras.callbacks.History` object.
@@ -147,23 +272,60 @@ def fit(
         `track_iterator` is True.
     """
     train_func = model.make_train_function()
-    train_iter, steps_per_epoch = as_infinite_iterator(train_data, steps_per_epoch)
+    steps_var = getattr(model, "_steps_per_execution", None)
+    execution_steps = 1 if steps_var is None else int(steps_var.numpy())
+    seekable = isinstance(train_data, SeekableData)
+    if seekable:
+        if track_iterator:
+            raise ValueError("track_iterator must be False if using SeekableData")
+        assert steps_per_epoch in (None, train_data.steps_per_epoch)
+        steps_per_epoch = train_data.steps_per_epoch
+        train_iter = None
+        if hasattr(model, "_train_data"):
+            raise AttributeError(
+                "Cannot fit model with existing `_train_data` attribute."
+            )
+        model._train_data = train_data  # pylint: disable=protected-access
+    else:
+        train_iter, steps_per_epoch = as_infinite_iterator(train_data, steps_per_epoch)
     if hasattr(model, "_train_iter"):
         raise AttributeError("Cannot fit model with existing `_train_iter` attribute.")
     if track_iterator:
         model._train_iter = train_iter  # pylint: disable=protected-access
 
+    callbacks = list(callbacks)
+    if verbose and not any(
+        isinstance(c, tf.keras.callbacks.ProgbarLogger) for c in callbacks
+    ):
+        callbacks.append(ThrottledProgbarLogger(progbar_interval))
     cb = tf.keras.callbacks.CallbackList(
-        callbacks=callbacks, add_history=True, add_progbar=verbose, model=model
+        callbacks=callbacks, add_history=True, add_progbar=False, model=model
     )
     cb.set_params(dict(epochs=epochs, verbose=int(verbose), steps=steps_per_epoch))
 
+    batch_hooks = any(_implements_train_batch_hooks(c) for c in cb.callbacks)
+
     cb.on_train_begin()
     initial_epoch = (
         model._maybe_load_initial_epoch_from_ckpt(  # pylint: disable=protected-access
             initial_epoch
         )
     )
+    initial_step = 0
+    training_state = getattr(model, "_training_state", None)
+    if hasattr(training_state, "maybe_load_initial_step_from_ckpt"):
+        # e.g. `kblocks.extras.callbacks.BackupAndRestore` with step-level backups
+        initial_step = training_state.maybe_load_initial_step_from_ckpt(initial_epoch)
+    if seekable:
+        # built after `on_train_begin` so it starts from the restored position
+        train_iter = iter(train_data.dataset)
+        initial_step = train_data.step if train_data.epoch == initial_epoch else 0
+
+    validator = None
+    if async_validation and validation_data is not None:
+        validator = _AsyncValidator(
+            model, validation_data, validation_steps, validation_device
+        )
 
     model.stop_training = False
     for epoch in range(initial_epoch, epochs):
@@ -171,20 +333,40 @@ def fit(
         cb.on_epoch_begin(epoch)
 
         logs = None
-        for step in range(steps_per_epoch):
-            cb.on_train_batch_begin(step)
-            logs = train_func(train_iter)
-            cb.on_train_batch_end(step, logs)
+        step = initial_step
+        while step < steps_per_epoch:
+            num_steps = min(execution_steps, steps_per_epoch - step)
+            if batch_hooks:
+                cb.on_train_batch_begin(step)
+            if num_steps == execution_steps:
+                logs = train_func(train_iter)
+            else:
+                # truncate the final execution of the epoch
+                steps_var.assign(num_steps)
+                logs = train_func(train_iter)
+                steps_var.assign(execution_steps)
+            if seekable:
+                train_data.advance(num_steps)
+            step += num_steps
+            if batch_hooks:
+                cb.on_train_batch_end(step - 1, logs)
             if model.stop_training:
                 break
-        assert logs is not None
-        epoch_logs = logs
-        if (
+        # logs is None if resuming from a backup made after the final step
+        epoch_logs = {} if logs is None else logs
+        should_eval = (
             validation_data is not None
             and model._should_eval(  # pylint: disable=protected-access
                 epoch, validation_freq
             )
-        ):
+        )
+        if validator is not None:
+            epoch_logs.update(validator.result())
+            if should_eval:
+                validator.submit(epoch)
+                if epoch == epochs - 1:
+                    epoch_logs.update(validator.result())
+        elif should_eval:
             logs = model.evaluate(
                 validation_data,
                 steps=validation_steps,
@@ -194,11 +376,17 @@ def fit(
             epoch_logs.update({"val_" + name: val for name, val in logs.items()})
         cb.on_epoch_end(epoch, epoch_logs)
         training_logs = epoch_logs
+        initial_step = 0
         if model.stop_training:
             break
+    if validator is not None:
+        training_logs.update(validator.result())
+        validator.close()
     cb.on_train_end(logs=training_logs)
     if track_iterator:
         del model._train_iter
+    if seekable:
+        del model._train_data
     return model.history
 
 
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from kblocks import models
+from kblocks.extras.callbacks.backup import BackupAndRestore
+
+
+def get_dataset(num_batches: int = 10, batch_size: int = 2) -> tf.data.Dataset:
+    x = np.random.default_rng(0).normal(size=(num_batches * batch_size, 3))
+    x = x.astype(np.float32)
+    return tf.data.Dataset.from_tensor_slices((x, x.sum(axis=1))).batch(batch_size)
+
+
+def get_model(**compile_kwargs) -> tf.keras.Model:
+    model = tf.keras.Sequential(
+        [tf.keras.layers.Dense(1, input_shape=(3,), kernel_initializer="zeros")]
+    )
+    return models.compiled(model, loss="mse", optimizer="sgd", **compile_kwargs)
+
+
+class BatchRecorder(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.begin = []
+        self.end = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.begin.append(batch)
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.end.append(batch)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptAt(tf.keras.callbacks.Callback):
+    def __init__(self, iteration: int):
+        super().__init__()
+        self._iteration = iteration
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.model.optimizer.iterations.numpy() == self._iteration:
+            raise Interrupted()
+
+
+class FitTest(tf.test.TestCase):
+    def test_steps_per_execution_remainder(self):
+        dataset = get_dataset(num_batches=10)
+        expected = get_model()
+        models.fit(expected, dataset, epochs=2, verbose=False)
+
+        model = get_model(steps_per_execution=4)
+        recorder = BatchRecorder()
+        models.fit(model, dataset, epochs=2, callbacks=[recorder], verbose=False)
+        # executions of 4, 4 and 2 steps each epoch
+        self.assertEqual(recorder.begin, [0, 4, 8] * 2)
+        self.assertEqual(recorder.end, [3, 7, 9] * 2)
+        self.assertEqual(model.optimizer.iterations.numpy(), 20)
+        steps_var = model._steps_per_execution  # pylint: disable=protected-access
+        self.assertEqual(steps_var.numpy(), 4)
+        # same batches in the same order
+        for actual, desired in zip(model.get_weights(), expected.get_weights()):
+            np.testing.assert_allclose(actual, desired, rtol=1e-5)
+
+    def test_async_validation(self):
+        dataset = get_dataset()
+        validation_data = get_dataset(num_batches=3)
+        model = get_model()
+        history = models.fit(
+            model,
+            dataset,
+            epochs=3,
+            validation_data=validation_data,
+            async_validation=True,
+            verbose=False,
+        )
+        # epoch 0 has no completed validation, epoch 1 has epoch 0's and the final
+        # epoch waits for its own
+        self.assertEqual(history.history["val_epoch"], [0, 2])
+        val_loss = history.history["val_loss"][-1]
+        expected = model.evaluate(validation_data, return_dict=True, verbose=0)
+        np.testing.assert_allclose(val_loss, expected["loss"], rtol=1e-5)
+
+    def test_mid_epoch_resume(self):
+        dataset = get_dataset(num_batches=10)
+        expected = get_model()
+        models.fit(expected, dataset, epochs=2, verbose=False)
+
+        backup_dir = os.path.join(self.get_temp_dir(), "backup")
+
+        def fit(callbacks):
+            model = get_model()
+            backup = BackupAndRestore(backup_dir, save_freq_steps=3)
+            models.fit(
+                model,
+                dataset,
+                epochs=2,
+                callbacks=[backup, *callbacks],
+                track_iterator=True,
+                verbose=False,
+            )
+            return model
+
+        # last backup after step 6 of epoch 1
+        with self.assertRaises(Interrupted):
+            fit([InterruptAt(18)])
+        recorder = BatchRecorder()
+        model = fit([recorder])
+        self.assertEqual(recorder.begin, [6, 7, 8, 9])
+        self.assertEqual(model.optimizer.iterations.numpy(), 20)
+        for actual, desired in zip(model.get_weights(), expected.get_weights()):
+            np.testing.assert_allclose(actual, desired, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    tf.test.main()
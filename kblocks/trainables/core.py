@@ -4,11 +4,12 @@ from typing import Any, Callable, Iterable, Optional, Tuple, Union
 import gin
 import tensorflow as tf
 
+from kblocks.data import metadata
 from kblocks.data.repeated import RepeatedData, dataset_and_steps
 
 
 def _validate_data(data: tf.data.Dataset, steps: Optional[int]):
-    cardinality = tf.keras.backend.get_value(data.cardinality())
+    cardinality = metadata.cardinality(data)
     if cardinality == tf.data.INFINITE_CARDINALITY:
         assert steps is not None
     else:
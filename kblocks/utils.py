@@ -1,9 +1,11 @@
 """Utilities used throughout kblocks."""
 import inspect
+import json
 from typing import Any, Callable, Iterable, List, Optional, TypeVar
 
 import gin
 import setproctitle
+import tensorflow as tf
 
 T = TypeVar("T")
 
@@ -42,6 +44,19 @@ def call(func: Callable, **kwargs):
     return func(**kwargs)
 
 
+def write_json(path: str, obj, **kwargs):
+    """
+    Atomically write `obj` as json to `path`.
+
+    `obj` is written to a temporary file which is then renamed to `path`, so readers
+    never see a partially written file. `kwargs` are passed to `json.dump`.
+    """
+    tmp_path = f"{path}.tmp"
+    with tf.io.gfile.GFile(tmp_path, "w") as fp:
+        json.dump(obj, fp, **kwargs)
+    tf.io.gfile.rename(tmp_path, path, overwrite=True)
+
+
 class memoized_property(property):  # pylint: disable=invalid-name
     """Descriptor that mimics @property but caches output in member variable."""
 